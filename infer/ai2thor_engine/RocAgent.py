@@ -4,11 +4,13 @@ try:
 except Exception as e:
     print(e)
 try:
-    from .utils import add_text_to_image, add_border, EventObject
+    from .utils import add_text_to_image, add_border, stitch_views, EventObject
 except Exception as e:
     print(e)
 
 from .baseAgent import BaseAgent
+from .navigability import navigability, event_navigability, legal_candidates, volume_distance_rows
+from .agent_positions import get_agent_positions
 from tqdm import tqdm
 import numpy as np
 import cv2, json
@@ -21,9 +23,18 @@ class RocAgent(BaseAgent):
     STATE_DECISION_MAKING_STATE = "decision_making"
     STATE_VERIFICATION = "verification"
     STATE_END = "end"
+    # 传送失败后重新选点的最大次数
+    MAX_TELEPORT_RETRIES = 20
+    # 四个角点处agent的朝向（朝向房间内）
+    CORNER_ROTATIONS = (225, 315, 135, 45)
+    # 全景相机相对agent的偏航角、标签和文字偏移（左、后、右）
+    PANORAMA_VIEWS = ((-90, "left view", 20), (180, "back view", 20), (90, "right view", 25))
     def __init__(self, controller, save_path="./data/", scene="FloorPlan203", 
-                 visibilityDistance=1.5, gridSize=0.25, fieldOfView=90, target_objects=[], related_objects=[], navigable_objects=[], taskid=0,platform_type="GPU"):
-        super().__init__(controller, scene, visibilityDistance, gridSize, fieldOfView,platform_type)
+                 visibilityDistance=1.5, gridSize=0.25, fieldOfView=90, target_objects=[], related_objects=[], navigable_objects=[], taskid=0,platform_type="GPU", initial_state=None, metadata_only=False, frame_writer=None, panorama_cameras=False):
+        # panorama_cameras: observe 用挂在agent上的三个相机一步拍全景，而不是原地转四次
+        self.panorama_cameras = panorama_cameras
+        self.render_instance_segmentation = panorama_cameras
+        super().__init__(controller, scene, visibilityDistance, gridSize, fieldOfView,platform_type, initial_state, metadata_only, frame_writer)
         self.env, self.executor, self.monitor, self.planner = self.build_agent()
         self.pre_navigate_location=""
         self.agent_state = []
@@ -66,14 +77,8 @@ class RocAgent(BaseAgent):
                 self.navigable_objects[navigable_obj] = 0
             self.navigable_objects[navigable_obj] += 1
         self.taskid = str(taskid)
-        self.objid2position={}
-        with open("./data/agent_positions.json") as f:
-            custom_position_data = json.load(f)
-        for taskid in custom_position_data:
-            temp_data = custom_position_data[taskid]
-            for objid in temp_data:
-                if objid != "scene" and objid != "tasktype" and objid != "taskname":
-                    self.objid2position[objid] = temp_data[objid]
+        # 标注位置在进程内只解析一次，所有agent共享（只读）
+        self.objid2position = get_agent_positions()
 
         # if self.taskid in custom_position_data:
         #     self.objid2position = custom_position_data[self.taskid]
@@ -133,70 +138,32 @@ class RocAgent(BaseAgent):
         scene_bounds7 = self.controller.last_event.metadata['sceneBounds']['cornerPoints'][7]
 
         # 3. 获取agent可达位置
-        event = self.controller.step(dict(action='GetReachablePositions'))
-        reachable_positions = event.metadata['actionReturn']
-        pre_target_positions = []
-        # 4. 计算与四个点最近的可达位置
-        min_distance = float("inf")
-        for i, scene_bounds in enumerate([scene_bounds2, scene_bounds3, scene_bounds6, scene_bounds7]):
-            for position in reachable_positions:
-                distance = math.sqrt((position['x']-scene_bounds[0])**2 + (position['z']-scene_bounds[2])**2)
-                if distance < min_distance:
-                    min_distance = distance
-                    target_position = position
-                    index = i
-        # 5. 设置agent的旋转角度
-        if index == 0:
-            # 180, 270
-            target_rotation = dict(x=0, y=225, z=0)
-        elif index == 1:
-            # 270, 360
-            target_rotation = dict(x=0, y=315, z=0)
-        elif index == 2:
-            # 90,180
-            target_rotation = dict(x=0, y=135, z=0)
-        else:
-            # 0,90
-            target_rotation = dict(x=0, y=45, z=0)
+        corners = [scene_bounds2, scene_bounds3, scene_bounds6, scene_bounds7]
+        # 4. 与四个点最近的可达位置按距离排好，传送失败时依次取下一个（跳过失败过的位置）
+        candidates = self.candidate_queue((self.scene, "reachable"), "corners",
+                                          lambda exclude: self.nearest_corner_position(corners, exclude))
+        target_position, index = candidates.pop()
         
         # 6. agent导航到可达位置
-        while True:
+        for attempt in range(self.MAX_TELEPORT_RETRIES + 1):
+            if target_position is None:
+                print("Teleport failed, no reachable positions left for the corner view.")
+                break
+            # 5. 设置agent的旋转角度
+            target_rotation = dict(x=0, y=self.CORNER_ROTATIONS[index], z=0)
             event = self.action.action_mapping["teleport"](self.controller, position=target_position, rotation=target_rotation, horizon=0)
             self.update_event()
             if event.metadata['lastActionSuccess']:
                 break
+            elif attempt == self.MAX_TELEPORT_RETRIES:
+                print(f"Teleport failed {attempt + 1} times, giving up on the corner view.")
             else:
-                pre_target_positions.append(target_position)
-                event = self.controller.step(dict(action='GetReachablePositions'))
-                reachable_positions = event.metadata['actionReturn']
-                
-                # 4. 计算与四个点最近的可达位置
-                min_distance = float("inf")
-                for i, scene_bounds in enumerate([scene_bounds2, scene_bounds3, scene_bounds6, scene_bounds7]):
-                    for position in reachable_positions:
-                        if position in pre_target_positions:
-                            continue
-                        distance = math.sqrt((position['x']-scene_bounds[0])**2 + (position['z']-scene_bounds[2])**2)
-                        if distance < min_distance:
-                            min_distance = distance
-                            target_position = position
-                            index = i
-                # 5. 设置agent的旋转角度
-                if index == 0:
-                    # 180, 270
-                    target_rotation = dict(x=0, y=225, z=0)
-                elif index == 1:
-                    # 270, 360
-                    target_rotation = dict(x=0, y=315, z=0)
-                elif index == 2:
-                    # 90,180
-                    target_rotation = dict(x=0, y=135, z=0)
-                else:
-                    # 0,90
-                    target_rotation = dict(x=0, y=45, z=0)
+                candidates.reject(target_position)
+                target_position, index = candidates.pop()
                 print("Teleport failed, retrying...")
-        self.action.action_mapping["teleport"](self.controller, position=target_position, rotation=target_rotation, horizon=0)
-        self.update_event()
+        if target_position is not None:
+            self.action.action_mapping["teleport"](self.controller, position=target_position, rotation=target_rotation, horizon=0)
+            self.update_event()
         # self.save_frame({"action": "init_agent_view"}, prefix_save_path="./data/init_scene_image")
         # self.action.action_mapping["rotate_right"](self.controller, 30)
         # self.update_legal_location()
@@ -209,6 +176,21 @@ class RocAgent(BaseAgent):
         legal_interactions = self.get_legal_interactions()
         return image_fp, legal_navigations, legal_interactions
 
+    # 离四个角点最近的可达位置：返回(位置, 角点序号)，exclude中的位置跳过
+    def nearest_corner_position(self, corners, exclude=()):
+        position_index = self.get_reachable_index()
+        target_position, index, min_distance = None, None, float("inf")
+        for i, corner in enumerate(corners):
+            position = position_index.nearest(corner[0], corner[2], exclude)
+            if position is None:
+                continue
+            distance = position_index.distance(position, corner[0], corner[2])
+            if distance < min_distance:
+                min_distance = distance
+                target_position = position
+                index = i
+        return target_position, index
+
     def navigate(self, itemtype):
         image_fp, legal_navigations, legal_interactions = None, None, None
     
@@ -249,6 +231,9 @@ class RocAgent(BaseAgent):
         # while(item['name'] == self.pre_navigate_location and len(self.objecttype2object[item['objectType']])>1):
         #     item = random.choice(self.objecttype2object[item['objectType']])
         # self.pre_navigate_location = item['name']
+        # 候选位置按优先级排好，传送失败时依次取下一个，跳过本场景失败过的位置
+        candidates = self.candidate_queue((self.scene, item["objectId"]), "ranking",
+                                          lambda exclude: self.compute_position_8(item, exclude=exclude))
         # 如果容器没打开，然后里面存在目标物体，就不能直接导航到目标物体
         if item["objectId"] in self.objid2position:
             target_position = self.objid2position[item["objectId"]]["agent_teleport_position"]
@@ -256,7 +241,7 @@ class RocAgent(BaseAgent):
             horizon = self.objid2position[item["objectId"]]["agent_cameraHorizon"]
             print("设定位置", self.objid2position)
         else:
-            target_position, target_rotation = self.compute_position_8(item, pre_target_positions=[])
+            target_position, target_rotation = candidates.pop()
             horizon = 60
         # self.arm_reset()
         if target_position is None:
@@ -264,13 +249,18 @@ class RocAgent(BaseAgent):
             return image_fp, legal_navigations, legal_interactions
         event = self.action.action_mapping["teleport"](self.controller, position=target_position, rotation=target_rotation, horizon=horizon)
         # 判断是否成功
-        pre_target_positions = []
         index = 0
         while not event.metadata['lastActionSuccess']:
             index += 1
+            if index > self.MAX_TELEPORT_RETRIES:
+                print(f"teleport failed {index} times, giving up")
+                break
             print(f"teleport failed, retrying...{index}")
-            pre_target_positions.append(target_position)
-            target_position, target_rotation = self.compute_position_8(item, pre_target_positions)
+            candidates.reject(target_position)
+            target_position, target_rotation = candidates.pop()
+            if target_position is None:
+                print("teleport failed, no reachable positions left")
+                break
             event = self.action.action_mapping["teleport"](self.controller, position=target_position, rotation=target_rotation)
             self.update_event()
         
@@ -293,42 +283,124 @@ class RocAgent(BaseAgent):
         # self.update_legal_location()
         return image_fp, legal_navigations, legal_interactions
     
-    def observe(self):
+    # save_views: 是否另外保存三个方向的单张画面
+    def observe(self, save_views=False):
+        # 全景相机模式：一步拍下三个方向；相机不可用时退回原地旋转
+        if self.panorama_cameras and not self.metadata_only:
+            first = self.ensure_panorama_cameras()
+            if first is not None:
+                result = self.observe_panorama(first, save_views)
+                if result is not None:
+                    return result
+
         image_fp, legal_navigations, legal_interactions = [], None, None
+        frames = []
         for i in range(3):
             self.action.action_mapping["rotate_left"](self.controller, 90)
-            
-            image_fp.append(self.save_frame({"step_count": str(self.step_count),
-                                        "i": str(i),
-                                        "action": "observe"},
-                                        prefix_save_path=self.result_dir))
+            frames.append(self.controller.last_event.frame)
+            if save_views:
+                image_fp.append(self.save_frame({"step_count": str(self.step_count),
+                                            "i": str(i),
+                                            "action": "observe"},
+                                            prefix_save_path=self.result_dir))
             legal_navigations = self.get_legal_navigations()
 
-        for i in range(3):
-            images = [cv2.imread(path) for path in image_fp]
-            img1 = add_text_to_image(images[0], "left view", (10, images[0].shape[0] - 20))
-            img2 = add_text_to_image(images[1], "back view", (10, images[1].shape[0] - 20))
-            img3 = add_text_to_image(images[2], "right view", (10, images[2].shape[0] - 25))
-            # 为图片添加边框（注意：只给中间的图片添加左右边框）
-            img2_with_border = add_border(img2, 5, (0, 0, 0))
-            # 水平拼接
-            img_h_concat = np.concatenate((img1, img2_with_border, img3), axis=1)
+        output_path = None
+        # 仅元数据模式下没有图像可拼接
+        if not self.metadata_only:
+            # 直接用内存中的画面拼接（左、后、右），只编码一次
+            img_h_concat = stitch_views(frames, ["left view", "back view", "right view"], [20, 20, 25], border_size=5)
             # 保存结果
-            output_path = self.save_frame({"step_count": str(self.step_count),
-                                            # "i": str(i),
+            path, image_name = self.frame_path({"step_count": str(self.step_count),
                                             "action": "observe"},
                                             prefix_save_path=self.result_dir)
-            try:
-                cv2.imwrite(output_path, img_h_concat)
-                break
-            except Exception as e:
-                print("try_save_image")
-                print(e)
+            output_path = self.frame_writer.write(f"{path}/{self.scene}{image_name}{self.frame_writer.extension}", img_h_concat, bgr=True)
         
         self.action.action_mapping["rotate_left"](self.controller, 90)
         legal_interactions = self.get_legal_interactions()
         
         return output_path, legal_navigations, legal_interactions
+
+    def panorama_pose(self):
+        """
+        主相机相对agent的高度、俯仰角和视野；蹲下、抬头低头、ChangeFOV后全景相机要跟着更新
+        """
+        metadata = self.controller.last_event.metadata
+        height = metadata["cameraPosition"]["y"] - metadata["agent"]["position"]["y"]
+        # 视野以相机配置为准：ChangeFOV之后self.fieldOfView仍是初始值
+        fieldOfView = self.camera_config().get("fieldOfView", self.fieldOfView)
+        return round(height, 3), round(metadata["agent"]["cameraHorizon"], 1), fieldOfView
+
+    def ensure_panorama_cameras(self):
+        """
+        在agent上挂三个朝左、后、右的第三方相机，随agent一起移动；每个场景只注册一次，姿态变化时更新
+        返回第一个相机在 third_party_camera_frames 中的下标，相机不可用时返回None
+        """
+        state = getattr(self.controller, "_panorama_cameras", None)
+        cameras = self.controller.last_event.metadata.get("thirdPartyCameras") or []
+        if state is not None and state["scene"] == self.scene and len(cameras) >= state["first"] + len(self.PANORAMA_VIEWS):
+            if state["failed"]:
+                return None
+            action = "UpdateThirdPartyCamera"
+        else:
+            # 新场景（reset 会清空第三方相机）
+            state = {"scene": self.scene, "first": len(cameras), "pose": None, "failed": False}
+            action = "AddThirdPartyCamera"
+
+        pose = self.panorama_pose()
+        if pose != state["pose"]:
+            height, horizon, fieldOfView = pose
+            for k, (yaw, _, _) in enumerate(self.PANORAMA_VIEWS):
+                camera = dict(position=dict(x=0, y=height, z=0), rotation=dict(x=horizon, y=yaw, z=0),
+                              fieldOfView=fieldOfView, agentPositionRelativeCoordinates=True)
+                if action == "AddThirdPartyCamera":
+                    event = self.controller.step(action=action, parent="agent", **camera)
+                else:
+                    event = self.controller.step(action=action, thirdPartyCameraId=state["first"] + k, **camera)
+                if not event.metadata["lastActionSuccess"]:
+                    # 当前场景不再尝试
+                    state["failed"] = True
+                    self.controller._panorama_cameras = state
+                    return None
+            state["pose"] = pose
+            self.controller._panorama_cameras = state
+        return state["first"]
+
+    def observe_panorama(self, first, save_views=False):
+        """
+        一步拍下左、后、右三个方向；每个方向可见的物体取自该相机的实例分割，
+        可导航物体在三个方向的并集上只算一次，可交互物体仍按正前方计算
+        """
+        n = len(self.PANORAMA_VIEWS)
+        event = self.controller.step(action="Done")
+        frames = event.third_party_camera_frames[first:first + n]
+        masks = (getattr(event, "third_party_instance_masks", None) or [])[first:first + n]
+        if len(frames) < n or len(masks) < n:
+            return None
+
+        # 与主相机的可见性一致：画面中出现且在可见距离内
+        near = {obj["objectId"] for obj in event.metadata["objects"] if obj["distance"] <= self.visibilityDistance}
+        visible_ids = set()
+        for mask in masks:
+            visible_ids.update(near.intersection(mask.keys()))
+
+        if save_views:
+            for i, frame in enumerate(frames):
+                path, image_name = self.frame_path({"step_count": str(self.step_count),
+                                                    "i": str(i),
+                                                    "action": "observe"},
+                                                    prefix_save_path=self.result_dir)
+                self.frame_writer.write(f"{path}/{self.scene}{image_name}{self.frame_writer.extension}", frame)
+        img_h_concat = stitch_views(frames, [label for _, label, _ in self.PANORAMA_VIEWS],
+                                    [offset for _, _, offset in self.PANORAMA_VIEWS], border_size=5)
+        path, image_name = self.frame_path({"step_count": str(self.step_count),
+                                            "action": "observe"},
+                                            prefix_save_path=self.result_dir)
+        output_path = self.frame_writer.write(f"{path}/{self.scene}{image_name}{self.frame_writer.extension}", img_h_concat, bgr=True)
+
+        legal_navigations = self.get_legal_navigations(visible_ids)
+        legal_interactions = self.get_legal_interactions()
+        return output_path, legal_navigations, legal_interactions
         
     def move_forward(self, distance=0.5):
         
@@ -553,6 +625,7 @@ class RocAgent(BaseAgent):
         
         image_fp, legal_navigations, legal_interactions = None, None, None
         self.action.action_mapping["pick_up"](self.controller, item['objectId'])
+        self.invalidate_layout()
         image_fp = self.save_frame({"step_count": str(self.step_count),
                                     "action": "pick_up",
                                     "item": item["objectType"]},
@@ -570,6 +643,7 @@ class RocAgent(BaseAgent):
         
         image_fp, legal_navigations, legal_interactions = None, None, None
         self.action.action_mapping["put_in"](self.controller, item['objectId'])
+        self.invalidate_layout()
         image_fp = self.save_frame({"step_count": str(self.step_count),
                                     "action": "put_in",
                                     "item": item["objectType"]},
@@ -615,6 +689,7 @@ class RocAgent(BaseAgent):
         
         image_fp, legal_navigations, legal_interactions = None, None, None
         self.action.action_mapping["open"](self.controller, item['objectId'])
+        self.invalidate_layout()
         image_fp = self.save_frame({"step_count": str(self.step_count),
                                     "action": "open",
                                     "item": item["objectType"]},
@@ -632,6 +707,7 @@ class RocAgent(BaseAgent):
         
         image_fp, legal_navigations, legal_interactions = None, None, None
         self.action.action_mapping["close"](self.controller, item['objectId'])
+        self.invalidate_layout()
         image_fp = self.save_frame({"step_count": str(self.step_count),
                                     "action": "close",
                                     "item": item["objectType"]},
@@ -643,6 +719,7 @@ class RocAgent(BaseAgent):
 
     def get_all_item_image(self):
         res = []
+        initial_state = self.snapshot()
         for item in tqdm(self.eventobject.get_objects(self.controller.last_event)[0]):
             # print(item["name"],self.eventobject.get_item_surface_area(item['name']))
             if item["name"] == "DiningTable_806ce8fd":#Book_e173324d Box_8e5b2c6b CellPhone_b8be2958
@@ -667,7 +744,7 @@ class RocAgent(BaseAgent):
                     "image_path": f"./data/item_image/{self.scene}_{item['name']}.png"
                 }
                 res.append(dic)
-                self.controller.reset(self.scene)
+                self.restore(initial_state)
         with open(f"./data/{self.scene}_objects.jsonl", "w") as f:
             import json
             for item in res:
@@ -675,6 +752,7 @@ class RocAgent(BaseAgent):
 
     def get_navigate_path(self):
         res = []
+        initial_state = self.snapshot()
         
         for item in tqdm(self.eventobject.get_objects(self.controller.last_event)[0]):
             # print(item["name"],self.eventobject.get_item_surface_area(item['name']))
@@ -730,7 +808,7 @@ class RocAgent(BaseAgent):
                     "image_path": f"./data/item_image/{self.scene}_{item['name']}.png"
                 }
                 res.append(dic)
-                self.controller.reset(self.scene)
+                self.restore(initial_state)
 
         with open(f"./data/{self.scene}_objects.jsonl", "w") as f:
             import json
@@ -822,93 +900,9 @@ class RocAgent(BaseAgent):
             f.write(json.dumps(dic, ensure_ascii=False)+"\n")
     
     def get_navigate_location(self):
-        metadata = self.controller.last_event.metadata
-        volumes = []
-        objectid2object={}
-        for obj in metadata["objects"]:
-            objectid2object[obj["objectId"]]=obj
-            if obj["objectType"]!="Floor":#去掉地板
-                size=obj["axisAlignedBoundingBox"]["size"]
-                # print(size)
-                v=size["x"]*size["y"]*size["z"]
-                dx=obj["axisAlignedBoundingBox"]["center"]["x"]
-                dz=obj["axisAlignedBoundingBox"]["center"]["z"]
-                agentx=metadata["agent"]["position"]["x"]
-                agentz=metadata["agent"]["position"]["z"]
-                d=math.sqrt((dx-agentx)**2+(dz-agentz)**2)
-                
-                # 计算横面积
-                sxz = size["x"] * size["z"]
-
-                # 计算纵向1面积
-                sxy = size["x"] * size["y"]
-
-                # 计算纵向2面积
-                szy = size["y"] * size["z"]
-
-                # 选择最大的面积作为 s
-                s = max(sxz, sxy, szy)
-                
-                # 计算体积与距离的比率
-                if d != 0:  # 防止除以零
-                    rate = v / d
-                else:
-                    rate = 0
-                    print(obj["objectId"],"d=0")  
-                rate=v/d
-                isnavigable=False
-                if obj["visible"]==True:#没有被挡住的情况下
-                    if v<0.01:#物体体积很小
-                        isnavigable=False
-                        #体积虽然小，但面积较大，且距离足够近
-                        # 1. s>0.5 10米内
-                        # 2. s>0.15 4米内
-                        # 3. s>0.08 2.5米内
-                        # 4. v>0.005 2米内
-                        if s>0.5 and d<10:
-                            isnavigable=True
-                        elif s>0.15 and d<4:
-                            isnavigable=True
-                        elif s>0.08 and d<2.5:
-                            isnavigable=True 
-                        elif v>0.005 and d<2:
-                            isnavigable=True 
-                        elif v>0.001 and d<1.5:
-                            isnavigable=True
-                        elif d<1:#体积虽然小，但距离足够近
-                            isnavigable=True
-                    else:
-                        isnavigable=True
-                        if rate<=0.02:#体积虽然大，但是距离太远v/d
-                            isnavigable=False
-                            if s>0.5 and d<10:# 排除面积的影响
-                                isnavigable=True
-                            elif s>0.15 and d<4:
-                                isnavigable=True
-                            elif s>0.08 and d<2.5:
-                                isnavigable=True 
-                            elif v>0.005 and d<2:
-                                isnavigable=True 
-                            elif v>0.001 and d<1.5:
-                                isnavigable=True
-                            elif d<1:#体积虽然小，但距离足够近
-                                isnavigable=True
-                                
-                volumes.append({
-                    "objectId":obj["objectId"],
-                    "objectType":obj["objectType"],
-                    "visible":obj["visible"],
-                    "volume":v,
-                    "s":s,
-                    "distance":d,
-                    "rate":rate,
-                    "isnavigable":isnavigable
-                })
-                sorted_volumes = sorted(volumes, key=lambda v: v["rate"])
-
         res = {}
-        for item in sorted_volumes:
-            res[item["objectId"]] = item
+        for item in volume_distance_rows(event_navigability(self.controller.last_event)):
+            res[item["objectId"]] = dict(item)
         #     if item['isnavigable']:
         #         if item["objectType"] not in self.objecttype2object:
         #             self.objecttype2object[item["objectType"]] = [objectid2object[item["objectId"]]]
@@ -920,13 +914,18 @@ class RocAgent(BaseAgent):
         return res
     
     # 全局可达位置
-    def get_legal_navigations(self):
-        objects = self.get_navigate_location()
-        for objectId, obj in objects.items():
-            if obj["isnavigable"]:
-                if obj["objectType"] not in self.navigable_objects:
-                    self.navigable_objects[obj["objectType"]] = 0
-                self.navigable_objects[obj["objectType"]] += 1
+    # visible_ids: 可见物体（默认用主相机的可见性）
+    def get_legal_navigations(self, visible_ids=None):
+        if visible_ids is None:
+            table = event_navigability(self.controller.last_event)
+        else:
+            table = navigability(self.controller.last_event.metadata, visible_ids)
+        for objectType, isnavigable in legal_candidates(table):
+            if not isnavigable:
+                continue
+            if objectType not in self.navigable_objects:
+                self.navigable_objects[objectType] = 0
+            self.navigable_objects[objectType] += 1
         
         return list(self.navigable_objects.keys())
 
@@ -941,12 +940,12 @@ class RocAgent(BaseAgent):
     # 全局可交互位置
     def get_legal_interactions(self):
         legal_interactions = {}
-        objects = self.get_navigate_location()
-        for objectId, obj in objects.items():
-            if (obj["visible"] and obj["objectType"] in self.get_current_container_obj()) or obj["isnavigable"]:
-                if obj["objectType"] not in legal_interactions:
-                    legal_interactions[obj["objectType"]] = 0
-                legal_interactions[obj["objectType"]] += 1
+        container_objects = self.get_current_container_obj()
+        for objectType, isnavigable in legal_candidates(event_navigability(self.controller.last_event)):
+            if isnavigable or objectType in container_objects:
+                if objectType not in legal_interactions:
+                    legal_interactions[objectType] = 0
+                legal_interactions[objectType] += 1
         
         self.legal_interactions = legal_interactions
         return list(self.legal_interactions.keys())
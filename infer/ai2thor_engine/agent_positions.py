@@ -0,0 +1,91 @@
+import os
+import json
+import pickle
+import hashlib
+import threading
+from typing import Dict
+
+# 人工标注的agent位置（按任务分组），展开成 objectId -> 位置
+DEFAULT_PATH = "./data/agent_positions.json"
+# 任务条目中不是物体的键
+META_KEYS = ("scene", "tasktype", "taskname")
+# 预编译索引放在用户自己的缓存目录，不写进（可能共享的）数据目录
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "embodied_reasoner")
+
+
+def build_index(custom_position_data: Dict) -> Dict[str, Dict]:
+    """
+    把按任务分组的位置数据展开成 objectId -> 位置，后面的任务覆盖前面的同一物体
+    """
+    objid2position = {}
+    for taskid in custom_position_data:
+        temp_data = custom_position_data[taskid]
+        for objid in temp_data:
+            if objid not in META_KEYS:
+                objid2position[objid] = temp_data[objid]
+    return objid2position
+
+
+class AgentPositionStore:
+    """
+    进程内共享的agent位置索引。JSON只在第一次使用或文件修改时间变化后解析一次，
+    展开后的索引同时写到用户缓存目录下的预编译文件（CACHE_DIR，按JSON的绝对路径区分），其他进程直接加载，不再解析JSON。
+    返回的字典在所有agent之间共享，只读。
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        digest = hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16]
+        self.index_path = os.path.join(CACHE_DIR, f"agent_positions-{digest}.pkl")
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._index = None
+
+    def get(self) -> Dict[str, Dict]:
+        stat = os.stat(self.path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if stamp != self._stamp:
+                self._index = self._load_prebuilt(stamp)
+                if self._index is None:
+                    with open(self.path) as f:
+                        self._index = build_index(json.load(f))
+                    self._save_prebuilt(stamp, self._index)
+                self._stamp = stamp
+            return self._index
+
+    def _load_prebuilt(self, stamp):
+        try:
+            with open(self.index_path, "rb") as f:
+                prebuilt = pickle.load(f)
+        except Exception:
+            return None
+        if prebuilt.get("source") != list(stamp):
+            return None
+        return prebuilt["index"]
+
+    def _save_prebuilt(self, stamp, index):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"source": list(stamp), "index": index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+        except OSError as e: # 缓存目录不可写时只用进程内缓存
+            print(f"Could not write {self.index_path}: {e}")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_agent_positions(path: str = DEFAULT_PATH) -> Dict[str, Dict]:
+    """
+    返回 objectId -> 标注的agent位置（共享、只读）
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = AgentPositionStore(path)
+    return store.get()
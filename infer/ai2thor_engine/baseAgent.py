@@ -1,7 +1,10 @@
 from .utils import EventObject
 from .components.Action import BaseAction
+from .spatial_index import CandidateQueue, PositionIndex, position_keys
+from .frame_writer import get_frame_writer
 import math
 import time
+import numpy as np
 from PIL import Image
 from ai2thor.controller import Controller
 from ai2thor.platform import CloudRendering
@@ -9,9 +12,11 @@ from abc import ABC, abstractmethod
 
 import threading
 class BaseAgent(ABC):
+    # 是否渲染实例分割（全景相机模式用它判断各个方向看到了哪些物体）
+    render_instance_segmentation = False
 
     def __init__(self, controller: Controller, scene="FloorPlan203", 
-                 visibilityDistance=1.5, gridSize=0.1, fieldOfView=90,platform_type="GPU"):
+                 visibilityDistance=1.5, gridSize=0.1, fieldOfView=90,platform_type="GPU", initial_state=None, metadata_only=False, frame_writer=None):
         
         # retries = 0
         # while retries < MAX_RETRIES:
@@ -48,39 +53,13 @@ class BaseAgent(ABC):
         self.visibilityDistance = visibilityDistance
         self.gridSize = gridSize
         self.fieldOfView = fieldOfView
-        if platform_type=="GPU":
-            controller.reset(
-                # platform=CloudRendering,
-                snapToGrid=False,
-                quality='Medium',
-                agentMode="default",
-                massThreshold=None,
-                scene=scene,
-                visibilityDistance=visibilityDistance,
-                # gridSize=gridSize,
-                renderDepthImage=False,
-                renderInstanceSegmentation=False,
-                width=800,
-                height=450,
-                fieldOfView=fieldOfView,
-            )
-        else: 
-            controller.reset(
-                snapToGrid=False,
-                quality='Medium',
-                agentMode="default",
-                massThreshold=None,
-                scene=scene,
-                visibilityDistance=visibilityDistance,
-                # gridSize=gridSize,
-                renderDepthImage=False,
-                renderInstanceSegmentation=False,
-                width=800,
-                height=450,
-                fieldOfView=fieldOfView,
-            )   
-        
+        self.platform_type = platform_type
+        # 仅元数据模式：不保存/拼接图像，用低画质渲染（用于奖励计算等只需要元数据的场景）
+        self.metadata_only = metadata_only
+        # 后台保存画面（默认进程内共享的异步PNG写入器）
+        self.frame_writer = frame_writer if frame_writer is not None else get_frame_writer()
         self.controller = controller
+        
         # self.controller = Controller(
         #     platform=CloudRendering, # 无头模式
         #     snapToGrid=False,
@@ -104,9 +83,57 @@ class BaseAgent(ABC):
         self.mermory = []
         self.action = BaseAction()
         self.legal_location = {} # 导航/交互的合法位置 (object_name, count)        
+        # GetReachablePositions/GetInteractablePoses的结果缓存，场景布局改变（拿起/放下/开关容器）后失效
+        self.layout_cache = {}
+        # 有场景快照时原地恢复，避免重新加载场景
+        if initial_state is None:
+            self.reset_scene()
+        else:
+            self.restore(initial_state)
         # self.arm_reset()
         self.update_event()
 
+    # 重新加载场景，回到初始状态
+    def reset_scene(self):
+        self.invalidate_layout()
+        # 仅元数据模式用最低画质，分辨率保持 16:9 的宽高比，视野范围不变
+        if self.metadata_only:
+            quality, width, height = 'Very Low', 320, 180
+        else:
+            quality, width, height = 'Medium', 800, 450
+        if self.platform_type=="GPU":
+            self.controller.reset(
+                # platform=CloudRendering,
+                snapToGrid=False,
+                quality=quality,
+                agentMode="default",
+                massThreshold=None,
+                scene=self.scene,
+                visibilityDistance=self.visibilityDistance,
+                # gridSize=gridSize,
+                renderDepthImage=False,
+                renderInstanceSegmentation=self.render_instance_segmentation,
+                width=width,
+                height=height,
+                fieldOfView=self.fieldOfView,
+            )
+        else: 
+            self.controller.reset(
+                snapToGrid=False,
+                quality=quality,
+                agentMode="default",
+                massThreshold=None,
+                scene=self.scene,
+                visibilityDistance=self.visibilityDistance,
+                # gridSize=gridSize,
+                renderDepthImage=False,
+                renderInstanceSegmentation=self.render_instance_segmentation,
+                width=width,
+                height=height,
+                fieldOfView=self.fieldOfView,
+            )   
+        self.controller._camera_config = {"fieldOfView": self.fieldOfView}
+
     @abstractmethod
     def predict_next_action(self):
         pass
@@ -158,37 +185,40 @@ class BaseAgent(ABC):
     def get_camera_rotation(self):
         return self.controller.last_event.pose_discrete[3]
 
-    def save_frame(self, kargs={}, prefix_save_path="./data/item_image"):
+    # 图片保存的目录和文件名后缀（目录不存在时创建）
+    def frame_path(self, kargs={}, prefix_save_path="./data/item_image"):
         import os
         if prefix_save_path != "./data/item_image":
             path = prefix_save_path
         else:
             path = os.path.join(prefix_save_path, self.scene)
-        if not os.path.exists(path):
-            os.makedirs(path)
+        self.frame_writer.ensure_dir(path)
         
         image_name = ""
         for key in kargs.keys():
             if key != "third_party_camera_frames" and key != "no_agent_view":
                 image_name += f"_{kargs[key]}"
+        return path, image_name
+
+    def save_frame(self, kargs={}, prefix_save_path="./data/item_image"):
+        if self.metadata_only:
+            return None
+        path, image_name = self.frame_path(kargs, prefix_save_path)
                 
         # 获取第三方相机的图像
         if "third_party_camera_frames" in kargs.keys():
-            image = Image.fromarray(self.controller.last_event.third_party_camera_frames[-1])
             # current_path = os.getcwd()
             # full_path = os.path.join(current_path, path)
             # full_path = os.path.normpath(full_path)
-            image.save(f"{path}/{self.scene}_third_party{image_name}.png", format="PNG")
+            self.frame_writer.write(f"{path}/{self.scene}_third_party{image_name}{self.frame_writer.extension}",
+                                    self.controller.last_event.third_party_camera_frames[-1])
             kargs.pop("third_party_camera_frames")
         
+        # 画面在后台编码保存，这里直接返回路径；需要立即读取文件时先调用 self.frame_writer.wait(path)
         if "no_agent_view" not in kargs.keys():
-            image = Image.fromarray(self.controller.last_event.frame)
-            # current_path = os.getcwd()
-            # full_path = os.path.join(current_path, path)
-            # full_path = os.path.normpath(full_path)
-            image.save(f"{path}/{self.scene}{image_name}.png", format="PNG")
+            self.frame_writer.write(f"{path}/{self.scene}{image_name}{self.frame_writer.extension}", self.controller.last_event.frame)
 
-        return f"{path}/{self.scene}{image_name}.png"
+        return f"{path}/{self.scene}{image_name}{self.frame_writer.extension}"
 
     def arm_reset(self):
         try:
@@ -204,38 +234,186 @@ class BaseAgent(ABC):
         except Exception as e:
             print(e)
 
-    # 调整agent的视野范围
+    # 当前相机参数，保存在controller上（复用controller的agent之间共享），未知时为空
+    def camera_config(self):
+        return getattr(self.controller, "_camera_config", {})
+
+    # 调整agent的视野范围：一次ChangeFOV，不重新加载场景；视野不变时不调用模拟器
     def adjust_agent_fieldOfView(self, fieldOfView):
-        self.backup()
-        self.controller.reset(self.scene, fieldOfView=fieldOfView)
-        self.recover()
+        if self.camera_config().get("fieldOfView") == fieldOfView:
+            return
+        event = self.controller.step(action="ChangeFOV", fieldOfView=fieldOfView)
+        if event.metadata["lastActionSuccess"]:
+            self.controller._camera_config = dict(self.camera_config(), fieldOfView=fieldOfView)
+        else:
+            # 不支持ChangeFOV时退回重新加载场景，再恢复agent和物体
+            state = self.snapshot()
+            state["camera"] = {"fieldOfView": fieldOfView}
+            self.controller.reset(self.scene, fieldOfView=fieldOfView)
+            self.controller._camera_config = {"fieldOfView": fieldOfView}
+            self.restore(state)
+        # 视野影响可交互位置
+        self.invalidate_layout()
 
     # 备份agent和object的状态
     def backup(self):
-        # agent 记录当前状态
-        angent_position = self.get_agent_position()
-        angent_rotation = self.get_agent_rotation()
-        agent_horizon = self.get_agent_horizon()
-        self.agent_state.append([angent_position, angent_rotation, agent_horizon])
+        self.agent_state.append(self.snapshot())
         # object 记录当前状态
         for item in self.eventobject.get_objects(self.controller.last_event)[0]:
             self.object_state[item["name"]] = item
 
     # 恢复最近一次agent和object的状态    
     def recover(self):
-        # 恢复agent状态
-        angent_position = self.agent_state[-1][0]
-        angent_rotation = self.agent_state[-1][1]
-        agent_horizon = self.agent_state[-1][2]
-        self.action.action_mapping["teleport"](self.controller, position=angent_position, rotation=angent_rotation, horizon=agent_horizon)
+        self.restore(self.agent_state[-1])
         self.update_event()
-        # 恢复object状态
+
+    # 场景快照：agent位姿、可移动物体位姿、打开/开关状态和手中物体
+    def snapshot(self):
+        metadata = self.controller.last_event.metadata
+        objects = {}
+        for obj in metadata["objects"]:
+            objects[obj["objectId"]] = {
+                "name": obj["name"],
+                "position": dict(obj["position"]),
+                "rotation": dict(obj["rotation"]),
+                "movable": obj["pickupable"] or obj["moveable"],
+                "openable": obj["openable"],
+                "isOpen": obj["isOpen"],
+                "openness": obj.get("openness", 1.0 if obj["isOpen"] else 0.0),
+                "toggleable": obj["toggleable"],
+                "isToggled": obj["isToggled"],
+            }
+        return {
+            "agent": {
+                "position": dict(metadata["agent"]["position"]),
+                "rotation": dict(metadata["agent"]["rotation"]),
+                "horizon": metadata["agent"]["cameraHorizon"],
+                "isStanding": metadata["agent"]["isStanding"],
+            },
+            "objects": objects,
+            "inventory": [item["objectId"] for item in metadata["inventoryObjects"]],
+            "camera": dict(self.camera_config()),
+            # 与快照布局共享的查询缓存（按引用保存，恢复后继续复用和填充）
+            "layout": self.layout_cache,
+        }
+
+    # 恢复场景快照：只对和当前状态不同的部分执行动作，物体位姿用一次SetObjectPoses批量恢复
+    def restore(self, snapshot):
+        metadata = self.controller.last_event.metadata
+        current = {obj["objectId"]: obj for obj in metadata["objects"]}
+        inventory = [item["objectId"] for item in metadata["inventoryObjects"]]
+        saved = snapshot["objects"]
+        held = set(inventory) | set(snapshot["inventory"]) # 手中物体的位姿随agent变化，单独处理
+
+        moved = [
+            objectId for objectId, state in saved.items()
+            if state["movable"] and objectId in current and objectId not in held
+            and not (self._same_vector(state["position"], current[objectId]["position"]) and self._same_vector(state["rotation"], current[objectId]["rotation"]))
+        ]
+        regrasp = inventory != snapshot["inventory"] or bool(moved and inventory)
+
+        # 1.放下手中物体，之后和其它物体一起放回原位
+        if regrasp and inventory:
+            self.controller.step(action="DropHandObject", forceAction=True)
+        # 2.先打开需要打开的容器，便于把物体放回容器内
+        for objectId, state in saved.items():
+            obj = current.get(objectId)
+            if obj is not None and state["openable"] and state["isOpen"] and (not obj["isOpen"] or abs(obj.get("openness", 1.0) - state["openness"]) > 1e-3):
+                self.controller.step(action="OpenObject", objectId=objectId, openness=state["openness"], forceAction=True)
+        # 3.SetObjectPoses会移除未列出的可移动物体，所以必须列出全部可移动物体
+        if moved or regrasp:
+            self.controller.step(
+                action="SetObjectPoses",
+                objectPoses=[
+                    {"objectName": state["name"], "position": state["position"], "rotation": state["rotation"]}
+                    for state in saved.values() if state["movable"]
+                ]
+            )
+        # 4.关闭容器、恢复开关状态
+        for objectId, state in saved.items():
+            obj = current.get(objectId)
+            if obj is None:
+                continue
+            if state["openable"] and not state["isOpen"] and obj["isOpen"]:
+                self.controller.step(action="CloseObject", objectId=objectId, forceAction=True)
+            if state["toggleable"] and state["isToggled"] != obj["isToggled"]:
+                self.controller.step(action="ToggleObjectOn" if state["isToggled"] else "ToggleObjectOff", objectId=objectId, forceAction=True)
+        # 5.恢复agent位姿
+        agent = snapshot["agent"]
+        self.action.action_mapping["teleport"](self.controller, position=agent["position"], rotation=agent["rotation"], horizon=agent["horizon"])
+        if self.controller.last_event.metadata["agent"]["isStanding"] != agent["isStanding"]:
+            self.action.action_mapping["stand" if agent["isStanding"] else "crouch"](self.controller)
+        # 6.重新拿起快照时手中的物体
+        if regrasp:
+            for objectId in snapshot["inventory"]:
+                self.controller.step(action="PickupObject", objectId=objectId, forceAction=True)
+        # 7.恢复相机视野（当前视野未知时不动相机）
+        camera = snapshot.get("camera", {})
+        if "fieldOfView" in camera and "fieldOfView" in self.camera_config():
+            self.adjust_agent_fieldOfView(camera["fieldOfView"])
+        self.layout_cache = snapshot.get("layout", {})
+        return self.controller.last_event
+
+    # 布局查询缓存：同一布局下重复导航不再重复调用模拟器
+    def get_reachable_positions(self):
+        return self._layout_query((self.scene, "reachable"), dict(action='GetReachablePositions'))
+
+    def get_interactable_poses(self, objectId):
+        return self._layout_query((self.scene, objectId), dict(action='GetInteractablePoses', objectId=objectId))
+
+    def _layout_query(self, key, action):
+        if key not in self.layout_cache:
+            event = self.controller.step(action)
+            if not event.metadata['lastActionSuccess']: # 失败的查询不缓存
+                return event.metadata['actionReturn'] or []
+            self.layout_cache[key] = event.metadata['actionReturn']
+        return self.layout_cache[key]
+
+    # 位置的网格索引和查询结果一起缓存，每组位置只建一次
+    def get_reachable_index(self):
+        return self._layout_index((self.scene, "reachable"), self.get_reachable_positions())
+
+    def get_interactable_index(self, objectId):
+        return self._layout_index((self.scene, objectId), self.get_interactable_poses(objectId))
+
+    def _layout_index(self, key, positions):
+        index = self.layout_cache.get(key + ("index",))
+        if index is None or index.positions is not positions:
+            index = PositionIndex(positions, self.gridSize)
+            if self.layout_cache.get(key) is positions:
+                self.layout_cache[key + ("index",)] = index
+        return index
+
+    # 传送失败过的位置：保存在布局缓存中，随场景快照在之后的episode中复用，布局改变后失效
+    def teleport_blacklist(self):
+        return self.layout_cache.setdefault((self.scene, "blacklist"), set())
+
+    # 重试传送用的候选队列；底层查询（key）成功缓存后排名也缓存在布局缓存中，同一布局下只排一次
+    def candidate_queue(self, key, name, next_candidate):
+        layout_cache = self.layout_cache
+        ranking = layout_cache.get(key + (name,))
+        if ranking is not None:
+            return CandidateQueue(next_candidate, ranking, self.teleport_blacklist())
+        ranking = CandidateQueue.new_ranking()
+        def ranked_candidate(exclude):
+            candidate = next_candidate(exclude)
+            if key in layout_cache:
+                layout_cache.setdefault(key + (name,), ranking)
+            return candidate
+        return CandidateQueue(ranked_candidate, ranking, self.teleport_blacklist())
+
+    # 物体位置或容器开合发生变化后调用；换成新字典而不是清空，快照中保存的旧布局缓存仍然有效
+    def invalidate_layout(self):
+        self.layout_cache = {}
+
+    @staticmethod
+    def _same_vector(a, b, tolerance=1e-3):
+        return all(abs(a[axis] - b[axis]) <= tolerance for axis in ("x", "y", "z"))
 
     def compute_position(self, item):
         target_position = None
         target_rotation = None
-        event = self.controller.step(dict(action='GetInteractablePoses', objectId=item['objectId']))
-        reachable_positions = event.metadata['actionReturn']
+        reachable_positions = self.get_interactable_poses(item['objectId'])
         # 如果该物品找不到交互位置，可能是物品被包含，或者物品没有交互位置，不保存该物品视觉信息
         if len(reachable_positions) == 0:
             print("No reachable positions found.")
@@ -281,34 +459,46 @@ class BaseAgent(ABC):
 
         return target_position, dict(x=0, y=target_position['rotation'], z=0)
 
-    def compute_position_1(self, item, reachable_positions):
-        target_position = None
-        target_rotation = None
-        min_distance = float('inf')
-        for position in reachable_positions:
-            distance = math.sqrt((position['x'] - item['position']['x'])**2 + (position['z'] - item['position']['z'])**2)
-            if distance < min_distance:
-                min_distance = distance
-                target_position = position
+    # reachable_positions可以是位置列表或PositionIndex
+    def compute_position_1(self, item, reachable_positions, exclude=(), max_distance=float('inf')):
+        if not isinstance(reachable_positions, PositionIndex):
+            reachable_positions = PositionIndex(reachable_positions, self.gridSize)
+        target_position = reachable_positions.nearest(item['position']['x'], item['position']['z'], exclude, max_distance)
+        if target_position is None:
+            return None, None
         rotation = target_position['rotation'] if "rotation" in target_position.keys() else 0
         return target_position, dict(x=0, y=rotation, z=0)
 
-    def compute_position_8(self, item, pre_target_positions):
+    # exclude: 已经排除的position_key集合，给出时不再由pre_target_positions计算
+    def compute_position_8(self, item, pre_target_positions=(), exclude=None):
         target_position = None
         target_rotation = None
-        event = self.controller.step(dict(action='GetInteractablePoses', objectId=item['objectId']))
-        # event = self.controller.step(dict(action='GetReachablePositions'))
-        reachable_positions = event.metadata['actionReturn']
-        reachable_positions = [position for position in reachable_positions if math.sqrt((position['x'] - item['position']['x'])**2 + (position['z'] - item['position']['z'])**2) <= 1.5]
-        if len(reachable_positions) == 0:
+        index = self.get_interactable_index(item['objectId'])
+        item_x, item_z = item['position']['x'], item['position']['z']
+        x, z = index.x, index.z
+        # 候选位置用布尔掩码表示：距离物体1.5米内、且没有传送失败过
+        reachable_positions = index.distances(item_x, item_z) <= 1.5
+        if not reachable_positions.any():
             print("No reachable positions found.")
             return target_position, target_rotation
-        if pre_target_positions != []:
-            reachable_positions = [position for position in reachable_positions \
-                               if position not in pre_target_positions]
+        if exclude is None:
+            exclude = position_keys(pre_target_positions)
+        if exclude:
+            reachable_positions &= ~index.mask(exclude)
+        # 某个坐标与物体相差不超过tolerance的候选位置，tolerance逐步放大直到存在候选位置
+        def in_band(axis):
+            for tolerance in [0.1, 0.2, 0.3, 0.4, 0.5]:
+                candidate_positions = reachable_positions & (np.abs(index.coordinates(axis) - item['position'][axis]) <= tolerance)
+                if candidate_positions.any():
+                    break
+            return candidate_positions
+        item_volume = self.eventobject.get_item_volume(self.controller.last_event, item['name'])
+        item_surface_area = self.eventobject.get_item_surface_area(self.controller.last_event, item['name'])
+        def closest(mask):
+            return self.closest_position(item, index, mask, item_volume, item_surface_area)
         # 如果物体体积小于0.01，选择距离最近的位置
-        if self.eventobject.get_item_volume(self.controller.last_event, item['name']) <= 0.1 and self.eventobject.get_item_surface_area(self.controller.last_event, item['name']) <= 1:
-            target_position, target_rotation = self.compute_position_1(item, reachable_positions)
+        if item_volume <= 0.1 and item_surface_area <= 1:
+            target_position, target_rotation = self.compute_position_1(item, index, exclude, max_distance=1.5)
             return target_position, target_rotation
         # Possible angles to choose from
         angles = [0, 45, 90, 135, 180, 225, 270, 315, 360]
@@ -317,85 +507,56 @@ class BaseAgent(ABC):
         item_rotation = 0 if item_rotation == 360 else item_rotation
         target_position = None
         target_rotation = None
-        candidate_positions = []
 
         if item_rotation == 180: # agent x最接近/相等，z比item小
             target_rotation = dict(x=0, y=0, z=0)
             # 将agent的x坐标与item的x坐标相等的位置,或者x坐标位置小于最小距离的位置, 
-            for tolerance in [0.1, 0.2, 0.3, 0.4, 0.5]:
-                if len(candidate_positions) == 0:
-                    candidate_positions = [position for position in reachable_positions if abs(position['x'] - item['position']['x']) <= tolerance]
-                else:
-                    break
-            front_positions = []
-            back_positions = []         
-            for position in candidate_positions:
-                if position['z'] < item['position']['z']:
-                    front_positions.append(position)
-                elif position['z'] > item['position']['z']:
-                    back_positions.append(position)
+            candidate_positions = in_band('x')
+            front_positions = candidate_positions & (z < item_z)
+            back_positions = candidate_positions & (z > item_z)
 
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
             
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_rotation is None and len(back_positions) > 0:
+            if target_rotation is None and back_positions.any():
                 target_rotation = dict(x=0, y=180, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
 
         elif item_rotation == 270: # agent z最接近/相等，x比item小
             target_rotation = dict(x=0, y=90, z=0)
             # 将agent的z坐标与item的z坐标相等的位置,或者z坐标位置小于最小距离的位置,
-            for tolerance in [0.1, 0.2, 0.3, 0.4, 0.5]:
-                if len(candidate_positions) == 0:
-                    candidate_positions = [position for position in reachable_positions if abs(position['z'] - item['position']['z']) <= tolerance]
-                else:
-                    break
-            front_positions = []
-            back_positions = []
-            for position in candidate_positions:
-                if position['x'] < item['position']['x']:
-                    front_positions.append(position)
-                elif position['x'] > item['position']['x']:
-                    back_positions.append(position)
+            candidate_positions = in_band('z')
+            front_positions = candidate_positions & (x < item_x)
+            back_positions = candidate_positions & (x > item_x)
 
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
             
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_position is None and len(back_positions) > 0:
+            if target_position is None and back_positions.any():
                 target_rotation = dict(x=0, y=270, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
             
         elif item_rotation == 0: # agent x最接近/相等，z比item大
             target_rotation = dict(x=0, y=180, z=0)
             # 将agent的x坐标与item的x坐标相等的位置,或者x坐标位置小于最小距离的位置
-            for tolerance in [0.1, 0.2, 0.3, 0.4, 0.5]:
-                if len(candidate_positions) == 0:
-                    candidate_positions = [position for position in reachable_positions if abs(position['z'] - item['position']['z']) <= tolerance]
-                else:
-                    break
-
-            front_positions = []
-            back_positions = []
-            for position in candidate_positions:
-                if position['z'] > item['position']['z']:
-                    front_positions.append(position)
-                elif position['z'] < item['position']['z']:
-                    back_positions.append(position)
+            candidate_positions = in_band('z')
+            front_positions = candidate_positions & (z > item_z)
+            back_positions = candidate_positions & (z < item_z)
             
             # 如果正面位置存在，选择夹角最小的位置
             target_position_front=None
-            if len(front_positions) > 0:
-                target_position_front = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position_front = closest(front_positions)
             
             # 如果正面位置不存在，选择夹角最小的背面位置
             target_position_back=None
-            if len(back_positions) > 0:
+            if back_positions.any():
                 target_rotation = dict(x=0, y=0, z=0)
-                target_position_back = self.compute_closest_positions(item, back_positions)
+                target_position_back = closest(back_positions)
 
             # 选择和物品距离最近的位置
             if target_position_front is not None and target_position_back is not None:
@@ -413,123 +574,90 @@ class BaseAgent(ABC):
         elif item_rotation == 90: # agent z最接近/相等，x比item大
             target_rotation = dict(x=0, y=270, z=0)
             # 将agent的z坐标与item的z坐标相等的位置,或者z坐标位置小于最小距离的位置, 
-            for tolerance in [0.1, 0.2, 0.3, 0.4, 0.5]:
-                if len(candidate_positions) == 0:
-                    candidate_positions = [position for position in reachable_positions if abs(position['z'] - item['position']['z']) <= tolerance]
-                else:
-                    break
-            front_positions = []
-            back_positions = []
-            for position in candidate_positions:
-                if position['x'] > item['position']['x']:
-                    front_positions.append(position)
-                elif position['x'] < item['position']['x']:
-                    back_positions.append(position)
+            candidate_positions = in_band('z')
+            front_positions = candidate_positions & (x > item_x)
+            back_positions = candidate_positions & (x < item_x)
             
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
             
             # 如果正面位置不存在，选择夹角最小的背面位置
-            elif len(back_positions) > 0:
+            elif back_positions.any():
                 target_rotation = dict(x=0, y=90, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
 
         elif item_rotation == 45: # agent x比item大，z比item大
             target_rotation = dict(x=0, y=225, z=0)
-            front_positions = []
-            back_positions = []
-            for position in reachable_positions:
-                # 将agent的x坐标大于item的x坐标的位置, 以及agent的z坐标大于item的z坐标的位置加入候选位置
-                if position['x'] > item['position']['x'] and position['z'] > item['position']['z']:
-                    front_positions.append(position)
-                elif position['x'] < item['position']['x'] and position['z'] < item['position']['z']:
-                    back_positions.append(position)
+            # 将agent的x坐标大于item的x坐标的位置, 以及agent的z坐标大于item的z坐标的位置加入候选位置
+            front_positions = reachable_positions & (x > item_x) & (z > item_z)
+            back_positions = reachable_positions & (x < item_x) & (z < item_z)
             
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
 
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_position is None and len(back_positions) > 0:
+            if target_position is None and back_positions.any():
                 target_rotation = dict(x=0, y=45, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
 
         elif item_rotation == 135: # agent x比item大，z比item小
             target_rotation = dict(x=0, y=315, z=0)
-            front_positions = []
-            back_positions = []
-            front_side_positions = []
-            back_side_positions = []
-            for position in reachable_positions:
-                # 将agent的x坐标小于item的x坐标的位置, 以及agent的z坐标大于item的z坐标的位置加入候选位置
-                if position['x'] > item['position']['x'] and position['z'] < item['position']['z']:
-                    front_positions.append(position)
-                elif position['x'] < item['position']['x'] and position['z'] > item['position']['z']:
-                    back_positions.append(position)
-                # 侧边位置x坐标大于item的x坐标的位置且z坐标大于item的z坐标
-                elif position['x'] > item['position']['x'] and position['z'] > item['position']['z']:
-                    front_side_positions.append(position)
-                # 侧边
-                elif position['x'] < item['position']['x'] and position['z'] < item['position']['z']:
-                    back_side_positions.append(position)
+            # 将agent的x坐标小于item的x坐标的位置, 以及agent的z坐标大于item的z坐标的位置加入候选位置
+            front_positions = reachable_positions & (x > item_x) & (z < item_z)
+            back_positions = reachable_positions & (x < item_x) & (z > item_z)
+            # 侧边位置x坐标大于item的x坐标的位置且z坐标大于item的z坐标
+            front_side_positions = reachable_positions & (x > item_x) & (z > item_z)
+            # 侧边
+            back_side_positions = reachable_positions & (x < item_x) & (z < item_z)
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_position is None and len(back_positions) > 0:
+            if target_position is None and back_positions.any():
                 target_rotation = dict(x=0, y=135, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
             # 如果正面位置和背面位置都不存在，选择侧边位置
-            if target_position is None and len(front_side_positions) > 0:
+            if target_position is None and front_side_positions.any():
                 target_rotation = dict(x=0, y=225, z=0)
-                target_position = self.compute_closest_positions(item, front_side_positions)
-            if target_position is None and len(back_side_positions) > 0:
+                target_position = closest(front_side_positions)
+            if target_position is None and back_side_positions.any():
                 target_rotation = dict(x=0, y=45, z=0)
-                target_position = self.compute_closest_positions(item, back_side_positions)
+                target_position = closest(back_side_positions)
 
         elif item_rotation == 225: # agent x比item小，z比item小
             target_rotation = dict(x=0, y=45, z=0)
-            front_positions = []
-            back_positions = []
-            for position in reachable_positions:
-                # 将agent的x坐标小于item的x坐标的位置, 以及agent的z坐标小于item的z坐标的位置加入候选位置
-                if position['x'] < item['position']['x'] and position['z'] < item['position']['z']:
-                    front_positions.append(position)
-                elif position['x'] > item['position']['x'] and position['z'] > item['position']['z']:
-                    back_positions.append(position)
+            # 将agent的x坐标小于item的x坐标的位置, 以及agent的z坐标小于item的z坐标的位置加入候选位置
+            front_positions = reachable_positions & (x < item_x) & (z < item_z)
+            back_positions = reachable_positions & (x > item_x) & (z > item_z)
 
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
             
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_position is None and len(back_positions) > 0:
+            if target_position is None and back_positions.any():
                 target_rotation = dict(x=0, y=225, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
                 
         elif item_rotation == 315: # agent x比item小，z比item大
             target_rotation = dict(x=0, y=135, z=0)
-            front_positions = []
-            back_positions = []
-            for position in reachable_positions:
-                # 将agent的x坐标大于item的x坐标的位置, 以及agent的z坐标小于item的z坐标的位置加入候选位置
-                if position['x'] < item['position']['x'] and position['z'] > item['position']['z']:
-                    front_positions.append(position)
-                elif position['x'] > item['position']['x'] and position['z'] < item['position']['z']:
-                    back_positions.append(position)
+            # 将agent的x坐标大于item的x坐标的位置, 以及agent的z坐标小于item的z坐标的位置加入候选位置
+            front_positions = reachable_positions & (x < item_x) & (z > item_z)
+            back_positions = reachable_positions & (x > item_x) & (z < item_z)
             
             # 如果正面位置存在，选择夹角最小的位置
-            if len(front_positions) > 0:
-                target_position = self.compute_closest_positions(item, front_positions)
+            if front_positions.any():
+                target_position = closest(front_positions)
 
             # 如果正面位置不存在，选择夹角最小的背面位置
-            if target_position is None and len(back_positions) > 0:
+            if target_position is None and back_positions.any():
                 target_rotation = dict(x=0, y=315, z=0)
-                target_position = self.compute_closest_positions(item, back_positions)
+                target_position = closest(back_positions)
 
         if target_position is None:
-            target_position, target_rotation = self.compute_position_1(item, reachable_positions)
+            target_position, target_rotation = self.compute_position_1(item, index, exclude, max_distance=1.5)
         return target_position, target_rotation
     
     def compute_closest_positions_xxx(self, item, candidate_positions, gap=0.1):
@@ -617,67 +745,51 @@ class BaseAgent(ABC):
             return target_position
 
     def compute_closest_positions(self, item, candidate_positions, gap=0.1):
-        item_position = item["position"]
         item_volume = self.eventobject.get_item_volume(self.controller.last_event, item['name'])
         item_surface_area = self.eventobject.get_item_surface_area(self.controller.last_event, item['name'])
+        index = PositionIndex(candidate_positions, self.gridSize)
+        return self.closest_position(item, index, np.ones(len(index), dtype=bool), item_volume, item_surface_area, gap)
+
+    # 在index中mask为True的候选位置里，按物体朝向直线和体积选择目标位置（逐点扫描的向量化版本，结果一致）
+    def closest_position(self, item, index, mask, item_volume, item_surface_area, gap=0.1):
+        item_position = item["position"]
+        candidates = np.flatnonzero(mask)
+        x, z = index.x[candidates], index.z[candidates]
         # 2.1 直线方程 AX+BZ+C=0
         A = 1
         B = -math.tan(math.radians(item['rotation']['y']))
         C = -item_position['x'] - B * item_position['z']
         
-        # 2.2 计算最接近直线的候选点（0.1）
-        min_dinstance = float('inf')
-        closest_points = []
-        for position in candidate_positions:
-            x0 = position['x']
-            z0 = position['z']
-            numerator = abs(A * z0 + B * x0 + C)
-            denominator = math.sqrt(A**2 + B**2)
-            distance =  numerator / denominator
-            if distance <= min_dinstance + gap:
-                if distance < min_dinstance:
-                    min_dinstance = distance
-                closest_points.append(position)
+        # 2.2 计算最接近直线的候选点（0.1）：与扫描到该点之前的最小距离相差不超过gap
+        line_distance = np.abs(A * z + B * x + C) / math.sqrt(A**2 + B**2)
+        min_before = np.concatenate(([np.inf], np.minimum.accumulate(line_distance)[:-1]))
+        closest_points = candidates[line_distance <= min_before + gap]
+        if len(closest_points) == 0:
+            return None
+        distance = np.sqrt((index.x[closest_points] - item_position['x'])**2 + (index.z[closest_points] - item_position['z'])**2)
 
         # 根据物体体积和表面积，选择合适的距离
         # 1.体积在0-0.1之间，选择距离最近的点
         if item_volume <= 0.2 and item_surface_area <=0.5:
-            min_distance = float('inf')
-            for position in closest_points:
-                distance = math.sqrt((position['x'] - item_position['x'])**2 + (position['z'] - item_position['z'])**2)
-                if distance < min_distance:
-                    min_distance = distance
-                    target_position = position
-            return target_position
+            return index.positions[closest_points[np.argmin(distance)]]
         
         # 2.体积在0.5-1之间，选择最大距离和最小距离中间的点,按照距离排序，选择中间的点
         elif item_volume <= 1 and item_surface_area <= 1:
-            closest_points = [position for position in closest_points
-                                if math.sqrt((position['x'] - item_position['x'])**2 + (position['z'] - item_position['z'])**2) <= 1]
-            closest_points = sorted(closest_points, key=lambda position: math.sqrt((position['x'] - item_position['x'])**2 + (position['z'] - item_position['z'])**2))
-            
-            return closest_points[len(closest_points)//2] if len(closest_points) != 0 else None
+            closest_points, distance = closest_points[distance <= 1], distance[distance <= 1]
+            closest_points = closest_points[np.argsort(distance, kind="stable")]
+            return index.positions[closest_points[len(closest_points)//2]] if len(closest_points) != 0 else None
         # 3.体积在1-～之间，选择距离最远的点
         # 从最接近直线的候选点中选择距离最远的点
         else:
-            max_distance = 0
-            target_position = None
-            closest_points = [position for position in closest_points
-                                if math.sqrt((position['x'] - item_position['x'])**2 + (position['z'] - item_position['z'])**2) <= 1]
-            for position in closest_points:
-                distance = math.sqrt((position['x'] - item_position['x'])**2 + (position['z'] - item_position['z'])**2)
-                if distance > max_distance:
-                    max_distance = distance
-                    target_position = position
-        
-        return target_position
+            closest_points, distance = closest_points[distance <= 1], distance[distance <= 1]
+            if len(closest_points) == 0 or distance.max() <= 0:
+                return None
+            return index.positions[closest_points[np.argmax(distance)]]
     
     def compute_position_(self, item):
         target_position = None
         target_rotation = None
-        event = self.controller.step(dict(action='GetInteractablePoses', objectId=item['objectId']))
-        # event = self.controller.step(dict(action='GetReachablePositions'))
-        reachable_positions = event.metadata['actionReturn']
+        reachable_positions = self.get_interactable_poses(item['objectId'])
         if len(reachable_positions) == 0:
             print("No reachable positions found.")
             return target_position, target_rotation
@@ -1141,15 +1253,8 @@ class BaseAgent(ABC):
             center = [(scene_bounds6[0]+scene_bounds7[0])/2, (scene_bounds6[1]+scene_bounds7[1])/2, (scene_bounds6[2]+scene_bounds7[2])/2]
         
         # 3. 获取agent可达位置
-        event = self.controller.step(dict(action='GetReachablePositions'))
-        reachable_positions = event.metadata['actionReturn']
         # 4. 计算与center最近的可达位置
-        min_distance = float("inf")
-        for position in reachable_positions:
-            distance = math.sqrt((position['x']-center[0])**2 + (position['z']-center[2])**2)
-            if distance < min_distance:
-                min_distance = distance
-                target_position = position
+        target_position = self.get_reachable_index().nearest(center[0], center[2])
 
         # 5. 设置agent的旋转角度
         
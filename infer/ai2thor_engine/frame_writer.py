@@ -0,0 +1,129 @@
+import os
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from typing import Iterable, Union
+
+
+class FrameWriter:
+    """
+    后台保存画面：编码和写文件在线程池中进行，模拟器线程只负责提交，立即拿到目标路径。
+    排队的画面数量不超过max_pending，队列满时提交会阻塞等待。需要立刻读取文件的调用方先调用wait()/flush()。
+    
+    image_format: "png"（compress_level为zlib压缩等级0-9）、"jpeg"/"webp"（quality）或 "npy"（原始数组）
+    """
+
+    EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp", "npy": ".npy"}
+
+    def __init__(self, image_format: str = "png", compress_level: int = 6, quality: int = 95,
+                 max_pending: int = 32, num_threads: int = 2, asynchronous: bool = True):
+        if image_format not in self.EXTENSIONS:
+            raise ValueError(f"Unknown frame format {image_format!r}, expected one of {list(self.EXTENSIONS)}")
+        self.image_format = image_format
+        self.extension = self.EXTENSIONS[image_format]
+        self.compress_level = compress_level
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(num_threads, thread_name_prefix="frame-writer") if asynchronous else None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pending = {}  # 文件路径 -> 还没写完或写入失败（保留到wait()/flush()抛出为止）的Future
+        self._dirs = set()  # 已经确认存在的目录
+
+    def ensure_dir(self, path: str):
+        if path not in self._dirs:
+            os.makedirs(path, exist_ok=True)
+            self._dirs.add(path)
+
+    def write(self, file_path: str, image: np.ndarray, bgr: bool = False) -> str:
+        """
+        保存一张画面（默认RGB，bgr=True表示OpenCV的BGR顺序），返回file_path。
+        画面数组在写完之前不能被修改。
+        """
+        if self._executor is None:
+            self._encode(file_path, image, bgr)
+            return file_path
+        with self._lock:
+            previous = self._pending.get(file_path)
+        if previous is not None: # 同一个文件按提交顺序写
+            try:
+                previous.result()
+            except Exception:
+                pass # 失败的旧画面被这次写入覆盖
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._encode, file_path, image, bgr)
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._pending[file_path] = future
+        future.add_done_callback(lambda done, file_path=file_path: self._finish(file_path, done))
+        return file_path
+
+    def wait(self, paths: Union[None, str, Iterable[str]] = None):
+        """
+        等待指定路径（None表示所有已提交的画面）写完，写入失败时抛出异常（每个失败只抛出一次）
+        """
+        with self._lock:
+            if paths is None:
+                futures = list(self._pending.items())
+            else:
+                paths = [paths] if isinstance(paths, str) else [path for path in paths if path]
+                futures = [(path, self._pending[path]) for path in paths if path in self._pending]
+        errors = []
+        for path, future in futures:
+            error = future.exception()
+            if error is not None:
+                with self._lock:
+                    if self._pending.get(path) is future:
+                        del self._pending[path]
+                        errors.append((path, error))
+        if errors:
+            path, error = errors[0]
+            raise OSError(f"Failed to save {len(errors)} frame(s), first {path}: {error}") from error
+
+    def flush(self):
+        self.wait()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    def _finish(self, file_path, future):
+        with self._lock:
+            # 失败的留在_pending中，由wait()/flush()抛出
+            if self._pending.get(file_path) is future and future.exception() is None:
+                del self._pending[file_path]
+        self._slots.release()
+        if future.exception() is not None:
+            print(f"Failed to save frame {file_path}: {future.exception()}")
+
+    def _encode(self, file_path, image, bgr):
+        if bgr:
+            image = image[..., ::-1]
+        if self.image_format == "npy":
+            np.save(file_path, image)
+            return
+        image = Image.fromarray(np.ascontiguousarray(image))
+        if self.image_format == "png":
+            image.save(file_path, format="PNG", compress_level=self.compress_level)
+        elif self.image_format == "jpeg":
+            image.save(file_path, format="JPEG", quality=self.quality)
+        else:
+            image.save(file_path, format="WEBP", quality=self.quality)
+
+
+_default_writer = None
+_default_writer_lock = threading.Lock()
+
+
+def get_frame_writer() -> FrameWriter:
+    """
+    进程内共享的画面写入器（PNG，异步）
+    """
+    global _default_writer
+    with _default_writer_lock:
+        if _default_writer is None:
+            _default_writer = FrameWriter()
+    return _default_writer
@@ -0,0 +1,131 @@
+import numpy as np
+from typing import Dict, List
+
+
+def object_arrays(metadata, visible_ids=None) -> Dict:
+    """
+    把场景中除地板外的物体转换成数组：包围盒尺寸、中心到agent的水平距离、可见性
+    visible_ids 不为空时用它代替元数据中主相机的可见性（例如多个相机视野的并集）
+    """
+    objects = [obj for obj in metadata["objects"] if obj["objectType"] != "Floor"] # 去掉地板
+    boxes = np.array([
+        (box["size"]["x"], box["size"]["y"], box["size"]["z"], box["center"]["x"], box["center"]["z"])
+        for box in (obj["axisAlignedBoundingBox"] for obj in objects)
+    ], dtype=np.float64).reshape(-1, 5)
+    agent = metadata["agent"]["position"]
+    return {
+        "objectId": [obj["objectId"] for obj in objects],
+        "objectType": [obj["objectType"] for obj in objects],
+        "visible": np.array([obj["visible"] == True if visible_ids is None else obj["objectId"] in visible_ids
+                             for obj in objects], dtype=bool),
+        "size": boxes[:, :3],
+        "distance": np.sqrt((boxes[:, 3] - agent["x"]) ** 2 + (boxes[:, 4] - agent["z"]) ** 2),
+    }
+
+
+def navigability(metadata, visible_ids=None) -> Dict:
+    """
+    一次性计算所有物体的体积、最大截面积、距离、体积距离比和是否可导航
+    """
+    table = object_arrays(metadata, visible_ids)
+    size = table["size"]
+    d = table["distance"]
+    v = size[:, 0] * size[:, 1] * size[:, 2]
+    # 横面积、纵向1面积、纵向2面积中最大的作为 s
+    s = np.maximum(np.maximum(size[:, 0] * size[:, 2], size[:, 0] * size[:, 1]), size[:, 1] * size[:, 2])
+    # 体积与距离的比率，距离为0时记为0
+    rate = np.divide(v, d, out=np.zeros_like(v), where=d != 0)
+
+    # 面积较大或体积不太小，且距离足够近
+    # 1. s>0.5 10米内
+    # 2. s>0.15 4米内
+    # 3. s>0.08 2.5米内
+    # 4. v>0.005 2米内
+    # 5. v>0.001 1.5米内
+    # 6. 1米内
+    close_enough = (
+        ((s > 0.5) & (d < 10))
+        | ((s > 0.15) & (d < 4))
+        | ((s > 0.08) & (d < 2.5))
+        | ((v > 0.005) & (d < 2))
+        | ((v > 0.001) & (d < 1.5))
+        | (d < 1)
+    )
+    # 体积很小的物体只看距离；体积大的物体 v/d 足够大即可，否则同样看距离
+    isnavigable = table["visible"] & np.where(v < 0.01, close_enough, (rate > 0.02) | close_enough)
+
+    table.update({"volume": v, "s": s, "rate": rate, "isnavigable": isnavigable})
+    return table
+
+
+def rate_order(table) -> np.ndarray:
+    """
+    按体积距离比从小到大排列的物体下标（比率相同时保持场景中的顺序），在表中只排一次
+    """
+    if "order" not in table:
+        table["order"] = np.argsort(table["rate"], kind="stable")
+    return table["order"]
+
+
+def navigable_indices(table) -> List[int]:
+    """
+    可导航物体的下标，按体积距离比从小到大排列
+    """
+    order = rate_order(table)
+    return order[table["isnavigable"][order]].tolist()
+
+
+def event_navigability(event) -> Dict:
+    """
+    按event缓存的navigability表：同一个event上的合法导航、合法交互和导航位置查询只计算一次
+    """
+    cached = getattr(event, "_navigability", None)
+    if cached is not None and cached[0] is event.metadata["objects"]:
+        return cached[1]
+    table = navigability(event.metadata)
+    try:
+        event._navigability = (event.metadata["objects"], table)
+    except AttributeError: # 不能挂属性的event不缓存
+        pass
+    return table
+
+
+def legal_candidates(table) -> List[tuple]:
+    """
+    按体积距离比排好的可见物体 (objectType, isnavigable)，合法导航和合法交互共用这一遍扫描
+    """
+    if "legal" not in table:
+        visible, isnavigable = table["visible"].tolist(), table["isnavigable"].tolist()
+        table["legal"] = [(table["objectType"][i], isnavigable[i]) for i in rate_order(table).tolist() if visible[i]]
+    return table["legal"]
+
+
+def get_volume_distance_rate(metadata) -> List[Dict]:
+    """
+    物体的体积/距离信息，按体积距离比从小到大排序
+    """
+    return volume_distance_rows(navigability(metadata))
+
+
+def volume_distance_rows(table) -> List[Dict]:
+    """
+    表中每个物体一行，按体积距离比从小到大排序，在表中只生成一次（调用方不要修改返回的行）
+    """
+    if "rows" in table:
+        return table["rows"]
+    order = rate_order(table)
+    columns = {name: table[name].tolist() for name in ("visible", "volume", "s", "distance", "rate", "isnavigable")}
+    table["rows"] = [
+        {
+            "objectId": table["objectId"][i],
+            "objectType": table["objectType"][i],
+            "visible": columns["visible"][i],
+            "volume": columns["volume"][i],
+            "s": columns["s"][i],
+            "distance": columns["distance"][i],
+            "rate": columns["rate"][i],
+            "isnavigable": columns["isnavigable"][i],
+        }
+        for i in order.tolist()
+    ]
+    return table["rows"]
@@ -0,0 +1,193 @@
+import math
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+
+
+def position_key(position: Dict):
+    """
+    可哈希的位置标识，与字典相等的判断一致（用于排除集合）
+    """
+    return tuple(sorted(position.items()))
+
+
+def position_keys(positions: Iterable[Dict]) -> set:
+    return {position_key(position) for position in positions}
+
+
+class PositionIndex:
+    """
+    可达位置的均匀网格索引（按x、z平面），对同一组位置只建一次。
+    支持最近点、k近邻、半径和坐标带查询，exclude为position_key集合，用于跳过已经失败的位置。
+    距离与原来的逐点扫描完全一致，距离相同时返回列表中靠前的位置，查询结果与线性扫描相同。
+    """
+
+    def __init__(self, positions: List[Dict], cell_size: float = 0.25):
+        self.positions = positions
+        self.cell_size = cell_size
+        # 坐标数组，用于向量化的候选位置筛选
+        self.x = np.array([position['x'] for position in positions], dtype=np.float64)
+        self.z = np.array([position['z'] for position in positions], dtype=np.float64)
+        self._slots = None
+        self.cells = {}
+        for i, position in enumerate(positions):
+            self.cells.setdefault(self._cell(position['x'], position['z']), []).append(i)
+        if self.cells:
+            self.min_x = min(cx for cx, _ in self.cells)
+            self.max_x = max(cx for cx, _ in self.cells)
+            self.min_z = min(cz for _, cz in self.cells)
+            self.max_z = max(cz for _, cz in self.cells)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _cell(self, x, z):
+        return math.floor(x / self.cell_size), math.floor(z / self.cell_size)
+
+    @staticmethod
+    def distance(position, x, z):
+        return math.sqrt((position['x'] - x)**2 + (position['z'] - z)**2)
+
+    def coordinates(self, axis: str) -> np.ndarray:
+        return self.x if axis == 'x' else self.z
+
+    def distances(self, x: float, z: float) -> np.ndarray:
+        """
+        所有位置到(x, z)的水平距离
+        """
+        return np.sqrt((self.x - x)**2 + (self.z - z)**2)
+
+    def mask(self, keys) -> np.ndarray:
+        """
+        位置的position_key在keys中时为True
+        """
+        if self._slots is None:
+            self._slots = {}
+            for i, position in enumerate(self.positions):
+                self._slots.setdefault(position_key(position), []).append(i)
+        mask = np.zeros(len(self.positions), dtype=bool)
+        for key in keys:
+            mask[self._slots.get(key, [])] = True
+        return mask
+
+    def _ring(self, cx, cz, r):
+        if r == 0:
+            yield cx, cz
+            return
+        for ix in range(cx - r, cx + r + 1):
+            yield ix, cz - r
+            yield ix, cz + r
+        for iz in range(cz - r + 1, cz + r):
+            yield cx - r, iz
+            yield cx + r, iz
+
+    def _ring_bound(self, x, z, cx, cz, r):
+        # 第r圈以外的点到查询点的最小距离
+        c = self.cell_size
+        return min(x - (cx - r) * c, (cx + r + 1) * c - x, z - (cz - r) * c, (cz + r + 1) * c - z)
+
+    def k_nearest(self, x: float, z: float, k: int, exclude=(), max_distance: float = float('inf')) -> List[Dict]:
+        """
+        距离(x, z)最近的k个位置，按距离从近到远
+        """
+        if not self.cells or k <= 0:
+            return []
+        cx, cz = self._cell(x, z)
+        max_r = max(abs(cx - self.min_x), abs(cx - self.max_x), abs(cz - self.min_z), abs(cz - self.max_z))
+        found = []
+        for r in range(max_r + 1):
+            for cell in self._ring(cx, cz, r):
+                for i in self.cells.get(cell, ()):
+                    position = self.positions[i]
+                    distance = self.distance(position, x, z)
+                    if distance <= max_distance and not (exclude and position_key(position) in exclude):
+                        found.append((distance, i))
+            found.sort()
+            del found[k:]
+            # 已有k个点且都比下一圈更近时停止（相等时继续，保证距离相同时取靠前的位置）
+            bound = self._ring_bound(x, z, cx, cz, r) - 1e-9
+            if (len(found) == k and found[-1][0] < bound) or bound > max_distance:
+                break
+        return [self.positions[i] for _, i in found]
+
+    def nearest(self, x: float, z: float, exclude=(), max_distance: float = float('inf')) -> Optional[Dict]:
+        found = self.k_nearest(x, z, 1, exclude, max_distance)
+        return found[0] if found else None
+
+    def within(self, x: float, z: float, radius: float, exclude=()) -> List[Dict]:
+        """
+        距离(x, z)不超过radius的位置，保持原列表顺序
+        """
+        x0, z0 = self._cell(x - radius, z - radius)
+        x1, z1 = self._cell(x + radius, z + radius)
+        indices = [
+            i
+            for cx in range(x0, x1 + 1)
+            for cz in range(z0, z1 + 1)
+            for i in self.cells.get((cx, cz), ())
+            if self.distance(self.positions[i], x, z) <= radius
+        ]
+        return self._collect(indices, exclude)
+
+    def band(self, axis: str, value: float, tolerance: float, exclude=()) -> List[Dict]:
+        """
+        某个坐标轴上与value相差不超过tolerance的位置，保持原列表顺序
+        """
+        low, high = math.floor((value - tolerance) / self.cell_size), math.floor((value + tolerance) / self.cell_size)
+        column = 0 if axis == 'x' else 1
+        indices = [
+            i
+            for cell, members in self.cells.items() if low <= cell[column] <= high
+            for i in members
+            if abs(self.positions[i][axis] - value) <= tolerance
+        ]
+        return self._collect(indices, exclude)
+
+    def _collect(self, indices, exclude):
+        positions = [self.positions[i] for i in sorted(indices)]
+        if exclude:
+            positions = [position for position in positions if position_key(position) not in exclude]
+        return positions
+
+
+class CandidateQueue:
+    """
+    按优先级排好的候选位置，用于传送失败后的重试。
+    next_candidate(exclude)返回排除exclude（前面候选的position_key集合）后最优的(位置, 附加信息)，没有时位置为None；
+    排名按需生成并保存在ranking中，多个队列可以共享同一份排名。pop()跳过blacklist中的位置。
+    """
+
+    def __init__(self, next_candidate, ranking: Optional[Dict] = None, blacklist: Optional[set] = None):
+        self.next_candidate = next_candidate
+        self.ranking = ranking if ranking is not None else self.new_ranking()
+        self.blacklist = blacklist if blacklist is not None else set()
+        self.cursor = 0
+
+    @staticmethod
+    def new_ranking() -> Dict:
+        return {"candidates": [], "keys": set(), "exhausted": False}
+
+    def pop(self):
+        """
+        下一个不在黑名单中的候选(位置, 附加信息)，候选用完时返回(None, None)
+        """
+        candidates = self.ranking["candidates"]
+        while True:
+            if self.cursor == len(candidates):
+                if self.ranking["exhausted"]:
+                    return None, None
+                position, extra = self.next_candidate(self.ranking["keys"])
+                if position is None:
+                    self.ranking["exhausted"] = True
+                    return None, None
+                candidates.append((position, extra))
+                self.ranking["keys"].add(position_key(position))
+            position, extra = candidates[self.cursor]
+            self.cursor += 1
+            if position_key(position) not in self.blacklist:
+                return position, extra
+
+    def reject(self, position: Dict):
+        """
+        记下失败的位置，之后共享同一黑名单的队列都会跳过它
+        """
+        self.blacklist.add(position_key(position))
@@ -4,161 +4,262 @@ import re
 # from .prompt import INSTRUCTION2ITEM_PROMPT
 import openai
 import cv2
+import numpy as np
+
+class ObjectTable:
+    """
+    一个event中物体的列式表：每个状态/可交互属性一列布尔数组，位置、包围盒和到agent的距离为浮点列。
+    多个条件的组合查询（例如 可见 & 可拿起 & 1.5米内）只需要对列做掩码运算。
+    列在第一次使用时才从metadata中取出，之后在同一event内复用。
+    """
+
+    # 浮点列 -> 从物体字典中取值的路径
+    FLOAT_COLUMNS = {
+        "x": ("position", "x"),
+        "y": ("position", "y"),
+        "z": ("position", "z"),
+        "size_x": ("axisAlignedBoundingBox", "size", "x"),
+        "size_y": ("axisAlignedBoundingBox", "size", "y"),
+        "size_z": ("axisAlignedBoundingBox", "size", "z"),
+        "center_x": ("axisAlignedBoundingBox", "center", "x"),
+        "center_y": ("axisAlignedBoundingBox", "center", "y"),
+        "center_z": ("axisAlignedBoundingBox", "center", "z"),
+        "distance": ("distance",),
+    }
+
+    def __init__(self, objects: List[dict]):
+        self.objects = objects
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.objects)
+
+    def flag(self, key: str) -> np.ndarray:
+        """
+        obj[key]为真的布尔列（和 `if obj[key]` 的判断一致）
+        """
+        if key not in self._columns:
+            self._columns[key] = np.array([bool(obj[key]) for obj in self.objects], dtype=bool)
+        return self._columns[key]
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            path = self.FLOAT_COLUMNS[name]
+            values = []
+            for obj in self.objects:
+                for step in path:
+                    obj = obj[step]
+                values.append(obj)
+            self._columns[name] = np.array(values, dtype=np.float64)
+        return self._columns[name]
+
+    def mask(self, *flags: str, max_distance: float = None) -> np.ndarray:
+        """
+        所有flags都为真（且到agent的距离不超过max_distance）的物体掩码
+        """
+        mask = np.ones(len(self.objects), dtype=bool)
+        for key in flags:
+            mask &= self.flag(key)
+        if max_distance is not None:
+            mask &= self.column("distance") <= max_distance
+        return mask
+
+    def select(self, mask: np.ndarray) -> List[dict]:
+        return [self.objects[i] for i in np.flatnonzero(mask)]
+
+
+class EventView:
+    """
+    一个event中物体的索引：按objectId、name、objectType建立映射，预先计算体积和最大截面积，
+    按属性筛选由列式表ObjectTable完成并缓存结果。每个event只在第一次查询时建立一次并挂在event上，
+    controller.last_event换成新的event后自动失效。
+    """
+
+    def __init__(self, event):
+        self.objects = event.metadata["objects"]
+        self.by_id = {}         # 同一objectId取第一个（和逐个查找一致）
+        self.by_name = {}       # 同名取第一个（和逐个查找一致）
+        self.item2object = {}   # 同名取最后一个（和get_objects一致）
+        self.by_type = {}
+        self.volume = {}
+        self.surface_area = {}
+        self._filters = {}
+        self._table = None
+        for obj in self.objects:
+            self.by_id.setdefault(obj["objectId"], obj)
+            self.item2object[obj["name"]] = obj
+            self.by_type.setdefault(obj["objectType"], []).append(obj)
+            if obj["name"] in self.by_name:
+                continue
+            self.by_name[obj["name"]] = obj
+            item_size = obj["axisAlignedBoundingBox"]["size"]
+            x = item_size["x"]
+            y = item_size["y"]
+            z = item_size["z"]
+            self.volume[obj["name"]] = round(x * y * z, 4)
+            self.surface_area[obj["name"]] = round(max(x*y, x*z, y*z), 4)
+
+    @classmethod
+    def of(cls, event) -> "EventView":
+        view = getattr(event, "_event_view", None)
+        if view is None or view.objects is not event.metadata["objects"]:
+            view = cls(event)
+            try:
+                event._event_view = view
+            except AttributeError: # 不能挂属性的event不缓存
+                pass
+        return view
+
+    @property
+    def table(self) -> ObjectTable:
+        if self._table is None:
+            self._table = ObjectTable(self.objects)
+        return self._table
+
+    def where(self, key: str) -> List[dict]:
+        """
+        key属性为真的物体（按metadata中的顺序），同一event内只筛选一次
+        """
+        if key not in self._filters:
+            self._filters[key] = self.table.select(self.table.flag(key))
+        return self._filters[key]
+
 
 class EventObject:
     @staticmethod
     def get_objects_type(event) -> List[str]:
-        objects = event.metadata["objects"]
-        return [obj["objectType"] for obj in objects]
+        return [obj["objectType"] for obj in EventView.of(event).objects]
 
     @staticmethod
     def get_objects(event) -> Tuple[List[dict], Dict[str, dict]]:
-        item2object = {}
-        objects = event.metadata["objects"]
-        for item in objects:
-            item2object[item["name"]] = item
-        return objects, item2object
+        view = EventView.of(event)
+        return view.objects, dict(view.item2object)
     
     @staticmethod
     def get_object_by_id(event, obj_id):
-        objects = event.metadata["objects"]
-        for obj in objects:
-            if obj["objectId"] == obj_id:
-                return obj
-        return None
+        return EventView.of(event).by_id.get(obj_id)
+
+    @staticmethod
+    def get_object_table(event) -> ObjectTable:
+        return EventView.of(event).table
+
+    @staticmethod
+    def select_objects(event, *flags: str, max_distance: float = None) -> List[dict]:
+        """
+        同时满足所有flags（且到agent的距离不超过max_distance）的物体，例如
+        select_objects(event, "visible", "pickupable", max_distance=1.5)
+        """
+        table = EventView.of(event).table
+        return table.select(table.mask(*flags, max_distance=max_distance))
+
+    @staticmethod
+    def get_objects_by_type(event, object_type: str) -> List[dict]:
+        return list(EventView.of(event).by_type.get(object_type, []))
     
     @staticmethod
     def get_all_item_position(event) -> dict:
-        item2position = {}
-        objects = event.metadata["objects"]
-        for item in objects:
-            item2position[item["name"]] = item["position"]
-        return item2position     
+        return {name: item["position"] for name, item in EventView.of(event).item2object.items()}     
 
     @staticmethod
     def get_visible_objects(event) -> Tuple[List[dict],List[dict]]:
-        objects = event.metadata["objects"]
-        return [obj['name'] for obj in objects if obj["visible"]], [obj for obj in objects if obj["visible"]]
+        visible = EventView.of(event).where("visible")
+        return [obj['name'] for obj in visible], list(visible)
 
     @staticmethod
     def get_isInteractable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isInteractable"]]
+        return list(EventView.of(event).where("isInteractable"))
 
     @staticmethod
     def get_receptacle_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["receptacle"]]
+        return list(EventView.of(event).where("receptacle"))
 
     @staticmethod
     def get_toggleable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["toggleable"]]
+        return list(EventView.of(event).where("toggleable"))
 
     @staticmethod
     def get_breakable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["breakable"]]
+        return list(EventView.of(event).where("breakable"))
 
     @staticmethod
     def get_isToggled_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isToggled"]]
+        return list(EventView.of(event).where("isToggled"))
 
     @staticmethod
     def get_isBroken_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isBroken"]]
+        return list(EventView.of(event).where("isBroken"))
 
     @staticmethod
     def get_canFillWithLiquid_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["canFillWithLiquid"]]
+        return list(EventView.of(event).where("canFillWithLiquid"))
 
     @staticmethod
     def get_isFilledWithLiquid_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isFilledWithLiquid"]]
+        return list(EventView.of(event).where("isFilledWithLiquid"))
 
     @staticmethod
     def get_fillLiquid_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["fillLiquid"]]
+        return list(EventView.of(event).where("fillLiquid"))
 
     @staticmethod
     def get_dirtyable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["dirtyable"]]
+        return list(EventView.of(event).where("dirtyable"))
 
     @staticmethod
     def get_isDirty_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isDirty"]]
+        return list(EventView.of(event).where("isDirty"))
 
     @staticmethod
     def get_canBeUsedUp_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["canBeUsedUp"]]
+        return list(EventView.of(event).where("canBeUsedUp"))
 
     @staticmethod
     def get_isUsedUp_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isUsedUp"]]
+        return list(EventView.of(event).where("isUsedUp"))
 
     @staticmethod
     def get_cookable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["cookable"]]
+        return list(EventView.of(event).where("cookable"))
 
     @staticmethod
     def get_isCooked_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isCooked"]]
+        return list(EventView.of(event).where("isCooked"))
 
     @staticmethod
     def get_isHeatSource_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isHeatSource"]]
+        return list(EventView.of(event).where("isHeatSource"))
 
     @staticmethod
     def get_isColdSource_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isColdSource"]]
+        return list(EventView.of(event).where("isColdSource"))
 
     @staticmethod
     def get_sliceable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["sliceable"]]
+        return list(EventView.of(event).where("sliceable"))
 
     @staticmethod
     def get_openable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["openable"]]
+        return list(EventView.of(event).where("openable"))
 
     @staticmethod
     def get_isOpen_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isOpen"]]
+        return list(EventView.of(event).where("isOpen"))
 
     @staticmethod
     def get_pickupable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["pickupable"]]
+        return list(EventView.of(event).where("pickupable"))
 
     @staticmethod
     def get_isPickedUp_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isPickedUp"]]
+        return list(EventView.of(event).where("isPickedUp"))
 
     @staticmethod
     def get_moveable_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["moveable"]]
+        return list(EventView.of(event).where("moveable"))
     
     @staticmethod
     def get_isMoving_objects(event, ) -> List[dict]:
-        objects = event.metadata["objects"]
-        return [obj for obj in objects if obj["isMoving"]]
+        return list(EventView.of(event).where("isMoving"))
     
     @staticmethod
     def get_object_color(event, object_id: str) -> str:
@@ -172,50 +273,27 @@ class EventObject:
 
     @staticmethod
     def get_item_mass(event, item_name: str) -> float:
-        objects = event.metadata["objects"]
-        for item in objects:
-            if item["name"] == item_name:
-                return item["mass"]
-        return 0.0
+        item = EventView.of(event).by_name.get(item_name)
+        return item["mass"] if item is not None else 0.0
     
     @staticmethod
     def get_item_volume(event, item_name: str) -> float:
-        objects = event.metadata["objects"]
-        for item in objects:
-            if item["name"] == item_name:
-                item_size = item["axisAlignedBoundingBox"]["size"]
-                return round(item_size["x"] * item_size["y"] * item_size["z"], 4)
-        return 0.0
+        return EventView.of(event).volume.get(item_name, 0.0)
     
     @staticmethod
     # 获取物品平面面积
     def get_item_surface_area(event, item_name: str) -> float:
-        objects = event.metadata["objects"]
-        for item in objects:
-            if item["name"] == item_name:
-                item_size = item["axisAlignedBoundingBox"]["size"]
-                x = item_size["x"]
-                y = item_size["y"]
-                z = item_size["z"]
-                max_surface= max(x*y, x*z, y*z)
-                return round(max_surface, 4)
-        return 0.0
+        return EventView.of(event).surface_area.get(item_name, 0.0)
     
     @staticmethod
     def get_item_position(event, item_name: str) -> dict:
-        objects = event.metadata["objects"]
-        for item in objects:
-            if item["name"] == item_name:
-                return item["position"]
-        return {}
+        item = EventView.of(event).by_name.get(item_name)
+        return item["position"] if item is not None else {}
     
     @staticmethod
     def get_item_orientation(event, item_name: str) -> dict:
-        objects = event.metadata["objects"]
-        for item in objects:
-            if item["name"] == item_name:
-                return item["rotation"]
-        return {}
+        item = EventView.of(event).by_name.get(item_name)
+        return item["rotation"] if item is not None else {}
 
 def add_text_to_image(image, text, position):
     """
@@ -233,6 +311,32 @@ def add_text_to_image(image, text, position):
 
     return cv2.putText(image, text, position, font, font_scale, font_color, thickness)
 
+def stitch_views(frames, labels, text_offsets, border_size=5):
+    """
+    把多张RGB画面直接拼成一张BGR全景图（用于cv2.imwrite）。
+    全景图一次性分配，每张画面转成BGR后写入对应区域并在该区域上加文字，中间的画面左右各留border_size像素的黑色边框，
+    结果与逐张读取PNG、加文字、加边框再拼接的图像一致。
+    
+    :param frames: RGB画面（event.frame），尺寸相同。
+    :param labels: 每张画面的文字。
+    :param text_offsets: 每张画面文字左下角到画面底部的距离。
+    :return: 拼接后的BGR图像。
+    """
+    height, width = frames[0].shape[:2]
+    middle = len(frames) // 2
+    panorama = np.zeros((height, width * len(frames) + 2 * border_size, 3), dtype=np.uint8)
+    left = 0
+    for i, (frame, label, offset) in enumerate(zip(frames, labels, text_offsets)):
+        if i == middle:
+            left += border_size
+        view = panorama[:, left:left + width]
+        view[...] = frame[..., ::-1] # RGB -> BGR
+        add_text_to_image(view, label, (10, height - offset))
+        left += width
+        if i == middle:
+            left += border_size
+    return panorama
+
 def add_border(image, border_size, border_color):
     """
     给图像添加边框。
@@ -0,0 +1,274 @@
+import os
+import time
+import atexit
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from ai2thor.controller import Controller
+
+from controller_trace import open_controller
+
+
+def default_controller_factory(scene: str) -> Controller:
+    """
+    Launch a new Unity process for the given scene with the settings used by EnvChecker.
+    """
+    return Controller(
+        scene=scene,
+        gridSize=0.25,
+        width=640,
+        height=480,
+        fieldOfView=90,
+        renderDepthImage=True
+    )
+
+
+class _PoolEntry:
+    def __init__(self, controller, scene):
+        self.controller = controller
+        self.scene = scene
+        self.last_used = time.monotonic()
+        self.state = {}  # per-controller scratch space shared by successive leases
+
+
+class ControllerLease:
+    """
+    A controller borrowed from a ControllerPool. Give it back with release(), or use it as a context manager.
+    `warm` is True when the controller already had `scene` loaded before this lease.
+    """
+
+    def __init__(self, pool, entry, warm):
+        self.pool = pool
+        self.entry = entry
+        self.controller = entry.controller
+        self.scene = entry.scene
+        self.warm = warm
+        self.released = False
+
+    @property
+    def state(self) -> Dict:
+        return self.entry.state
+
+    def release(self, broken: bool = False, wait: bool = True):
+        if self.released:
+            return
+        self.released = True
+        if broken:
+            self.pool.discard(self.controller, wait=wait)
+        else:
+            self.pool.release(self.controller)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(broken=exc_type is not None)
+        return False
+
+
+class ControllerPool:
+    """
+    Process-wide pool of live AI2THOR controllers keyed by scene.
+
+    Starting Unity and loading a scene dominates the cost of a short reward rollout, so controllers
+    are leased out, reset to the episode start by the agent and returned instead of being stopped.
+    At most `max_size` controllers are alive at once; idle controllers are kept in LRU order, capped
+    at `max_idle_per_scene` per scene and stopped after `idle_timeout` seconds without a lease
+    (None or <= 0 keeps them until shutdown).
+    """
+
+    # shortest pause between two idle scans of the reaper thread
+    MIN_REAP_INTERVAL = 1.0
+
+    def __init__(self, max_size: int = 4, max_idle_per_scene: int = 2, idle_timeout: Optional[float] = 600.0,
+                 controller_factory: Optional[Callable[[str], Controller]] = None):
+        assert max_size > 0, "The pool needs room for at least one controller."
+        self.max_size = max_size
+        self.max_idle_per_scene = max_idle_per_scene
+        self.idle_timeout = idle_timeout if idle_timeout is not None and idle_timeout > 0 else None
+        self.controller_factory = controller_factory or default_controller_factory
+
+        self._cond = threading.Condition()
+        self._idle = OrderedDict()  # id(controller) -> _PoolEntry, least recently used first
+        self._leased = {}  # id(controller) -> _PoolEntry
+        self._starting = 0  # controllers being launched outside the lock
+        self._closed = False
+        self._reaper = None
+
+        self.stats = {"created": 0, "warm_leases": 0, "cold_leases": 0, "evicted": 0}
+
+    def __len__(self):
+        with self._cond:
+            return len(self._idle) + len(self._leased) + self._starting
+
+    def lease(self, scene: str, timeout: Optional[float] = None) -> ControllerLease:
+        """
+        Borrow a controller for `scene`. Prefers an idle controller that already has the scene loaded,
+        then launches a new one if there is room, then recycles the least recently used idle controller
+        of another scene. Blocks until a controller is returned when the pool is exhausted.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        to_stop = []
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("The controller pool has been shut down.")
+                to_stop.extend(self._pop_expired())
+
+                entry = self._take_idle(scene)
+                if entry is not None:
+                    self.stats["warm_leases"] += 1
+                    lease = ControllerLease(self, entry, warm=True)
+                    break
+
+                if len(self._idle) + len(self._leased) + self._starting < self.max_size:
+                    self._starting += 1
+                    lease = None
+                    break
+
+                if self._idle:
+                    _, entry = self._idle.popitem(last=False)
+                    entry.scene = scene
+                    entry.state.clear()
+                    self._leased[id(entry.controller)] = entry
+                    self.stats["cold_leases"] += 1
+                    lease = ControllerLease(self, entry, warm=False)
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No controller became available for scene '{scene}'.")
+                self._cond.wait(remaining)
+
+        self._stop_all(to_stop)
+        if lease is not None:
+            return lease
+
+        # launch outside the lock, Unity startup takes seconds
+        try:
+            controller = open_controller(scene, self.controller_factory)
+        except Exception:
+            with self._cond:
+                self._starting -= 1
+                self._cond.notify()
+            raise
+        entry = _PoolEntry(controller, scene)
+        with self._cond:
+            self._starting -= 1
+            self._leased[id(controller)] = entry
+            self.stats["created"] += 1
+            self.stats["cold_leases"] += 1
+            self._start_reaper()
+        return ControllerLease(self, entry, warm=False)
+
+    def release(self, controller: Controller):
+        """
+        Return a leased controller to the idle set.
+        """
+        to_stop = []
+        with self._cond:
+            entry = self._leased.pop(id(controller), None)
+            if entry is None:
+                return
+            if self._closed:
+                to_stop.append(entry)
+            else:
+                entry.last_used = time.monotonic()
+                self._idle[id(controller)] = entry
+                same_scene = [key for key, idle in self._idle.items() if idle.scene == entry.scene]
+                for key in same_scene[:max(0, len(same_scene) - self.max_idle_per_scene)]:
+                    to_stop.append(self._idle.pop(key))
+                self.stats["evicted"] += len(to_stop)
+            self._cond.notify()
+        self._stop_all(to_stop)
+
+    def discard(self, controller: Controller, wait: bool = True):
+        """
+        Drop a leased controller that is no longer usable (crashed, hung or in an unknown state).
+        With wait=False it is stopped on a background thread, for controllers that may never answer.
+        """
+        with self._cond:
+            entry = self._leased.pop(id(controller), None)
+            self._cond.notify()
+        if entry is None:
+            return
+        if wait:
+            self._stop_all([entry])
+        else:
+            threading.Thread(target=self._stop_all, args=([entry],), name="controller-pool-stop", daemon=True).start()
+
+    def shutdown(self):
+        """
+        Stop every idle controller; leased controllers are stopped when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            to_stop = list(self._idle.values())
+            self._idle.clear()
+            self._cond.notify_all()
+        self._stop_all(to_stop)
+
+    def _take_idle(self, scene):
+        # most recently used controller with the scene already loaded
+        for key in reversed(self._idle):
+            if self._idle[key].scene == scene:
+                entry = self._idle.pop(key)
+                self._leased[key] = entry
+                return entry
+        return None
+
+    def _pop_expired(self):
+        if self.idle_timeout is None:
+            return []
+        now = time.monotonic()
+        expired = [key for key, entry in self._idle.items() if now - entry.last_used > self.idle_timeout]
+        self.stats["evicted"] += len(expired)
+        return [self._idle.pop(key) for key in expired]
+
+    def _start_reaper(self):
+        if self.idle_timeout is None or self._reaper is not None:
+            return
+        self._reaper = threading.Thread(target=self._reap, name="controller-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while True:
+            with self._cond:
+                if self._closed:
+                    return
+                self._cond.wait(max(self.idle_timeout / 2, self.MIN_REAP_INTERVAL))
+                to_stop = self._pop_expired()
+            self._stop_all(to_stop)
+
+    @staticmethod
+    def _stop_all(entries):
+        for entry in entries:
+            try:
+                entry.controller.stop()
+            except Exception as e:
+                print(f"Failed to stop controller for scene '{entry.scene}': {e}")
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_controller_pool() -> Optional[ControllerPool]:
+    """
+    Return the process-wide controller pool, created on first use.
+    The size is read from PLAN_REWARD_POOL_SIZE; 0 disables pooling and returns None.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            max_size = int(os.environ.get("PLAN_REWARD_POOL_SIZE", "4"))
+            if max_size <= 0:
+                return None
+            _default_pool = ControllerPool(
+                max_size=max_size,
+                max_idle_per_scene=int(os.environ.get("PLAN_REWARD_POOL_IDLE_PER_SCENE", "2")),
+                idle_timeout=float(os.environ.get("PLAN_REWARD_POOL_IDLE_TIMEOUT", "600")),
+            )
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
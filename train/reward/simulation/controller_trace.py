@@ -0,0 +1,326 @@
+import os
+import glob
+import json
+import zlib
+import pickle
+import hashlib
+import threading
+from typing import Callable, Dict, Optional
+
+
+class TraceMiss(Exception):
+    """
+    The replay controller was asked for a request that is not in the trace after the current state.
+    """
+
+
+def step_request(action=None, kwargs=None) -> Dict:
+    """
+    Normalized Controller.step arguments: step("A", x=1) and step(dict(action="A", x=1)) are the same request.
+    """
+    request = dict(action) if isinstance(action, dict) else dict(kwargs or {}, action=action)
+    if isinstance(action, dict) and kwargs:
+        request.update(kwargs)
+    return {"call": "step", **request}
+
+
+def reset_request(args=(), kwargs=None) -> Dict:
+    request = dict(kwargs or {})
+    if args:
+        request["scene"] = args[0]
+    return {"call": "reset", **request}
+
+
+def request_key(request: Dict) -> str:
+    return json.dumps(request, sort_keys=True, default=str)
+
+
+# Queries that only read the object layout. The agent caches their answers per layout, so whether and
+# from which agent pose they are sent depends on what ran before in the process; they are answered by the
+# layout they were sent in.
+LAYOUT_QUERIES = ("GetReachablePositions", "GetInteractablePoses")
+# Teleports land on (or fail at) their target whatever the agent pose was, and which targets are tried
+# depends on the teleport blacklist the agent keeps across episodes; they are answered by the layout and
+# the camera they were sent in. Every other request is answered by the full state (layout, camera and pose).
+TELEPORTS = ("Teleport", "TeleportFull")
+# what a layout query's or a failed teleport's event adds to the state it was sent in
+QUERY_FIELDS = ("lastAction", "lastActionSuccess", "errorMessage", "actionReturn")
+
+
+def _fingerprint(parts) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+
+
+def layout_key(metadata: Dict) -> str:
+    """
+    Fingerprint of the object layout: object poses, open states and the held objects.
+    """
+    objects = sorted(
+        [
+            obj["objectId"],
+            [round(obj["position"][axis], 3) for axis in "xyz"],
+            [round(obj["rotation"][axis], 1) for axis in "xyz"],
+            obj.get("isOpen"),
+            round(obj.get("openness") or 0.0, 3),
+        ]
+        for obj in metadata["objects"]
+    )
+    inventory = sorted(item["objectId"] for item in metadata.get("inventoryObjects") or [])
+    return "layout:" + _fingerprint([metadata.get("sceneName"), objects, inventory])
+
+
+def camera_key(metadata: Dict) -> str:
+    """
+    Fingerprint of the layout plus the camera settings: the field of view and the third party cameras.
+    """
+    camera = [metadata.get("fov"), len(metadata.get("thirdPartyCameras") or [])]
+    return "camera:" + _fingerprint([layout_key(metadata), camera])
+
+
+def state_key(metadata: Dict) -> str:
+    """
+    Fingerprint of the simulator state: the layout and the camera plus the agent pose.
+    """
+    agent = metadata["agent"]
+    pose = [
+        [round(agent["position"][axis], 3) for axis in "xyz"],
+        [round(agent["rotation"][axis], 1) for axis in "xyz"],
+        round(agent.get("cameraHorizon") or 0.0, 1),
+        agent.get("isStanding"),
+    ]
+    return "state:" + _fingerprint([camera_key(metadata), pose])
+
+
+def request_parent(event, request: Dict) -> str:
+    """
+    Where `request` hangs in the trace when it is sent while `event` is the controller's last event.
+    The fingerprints are cached on the event, which is asked once per request.
+    """
+    action = request.get("action")
+    if action in LAYOUT_QUERIES:
+        name, fingerprint = "_trace_layout", layout_key
+    elif action in TELEPORTS:
+        name, fingerprint = "_trace_camera", camera_key
+    else:
+        name, fingerprint = "_trace_state", state_key
+    key = getattr(event, name, None)
+    if key is None:
+        key = fingerprint(event.metadata)
+        try:
+            setattr(event, name, key)
+        except AttributeError:
+            pass
+    return key
+
+
+class TraceEvent:
+    """
+    Stand-in for ai2thor.server.Event built from a trace: the metadata, the agent pose and, when they
+    were recorded, the frames.
+    """
+
+    def __init__(self, metadata: Dict, pose_discrete=None, frame=None, third_party_camera_frames=None):
+        self.metadata = metadata
+        self.pose_discrete = pose_discrete
+        self.frame = frame
+        self.third_party_camera_frames = third_party_camera_frames or []
+
+
+class ControllerTrace:
+    """
+    Simulator requests and the events they produced. A reset (or the scene a controller was launched
+    with) is answered by its arguments alone; a step is answered by the state it was sent in, so a state
+    reached through a reset, a restored snapshot or any other path is served the same way, and recorded
+    episodes can be replayed alone or in any order. See LAYOUT_QUERIES and TELEPORTS for the requests
+    answered by less than the full state.
+
+    On disk a trace is a directory of append-only files (one per recording process) holding pickled
+    (state, request key, compressed event) records; a record is written as soon as its event is seen so
+    that worker processes killed without cleanup still leave a usable trace.
+    """
+
+    def __init__(self):
+        self.events = {}  # (state fingerprint or None for resets, request key) -> compressed pickled event fields
+        self._lock = threading.Lock()
+        self._file = None
+
+    def __len__(self):
+        return len(self.events)
+
+    def find(self, state: Optional[str], request: Dict) -> Optional[TraceEvent]:
+        """
+        A fresh event on every call, like the simulator, so callers may modify what they get.
+        """
+        payload = self.events.get((state, request_key(request)))
+        return None if payload is None else TraceEvent(**pickle.loads(zlib.decompress(payload)))
+
+    def add(self, state: Optional[str], request: Dict, event, frames: bool = False):
+        """
+        Store the event `request` produced in `state`; only the first event seen for it is kept.
+        """
+        key = (state, request_key(request))
+        with self._lock:
+            if key in self.events:
+                return
+            fields = {"metadata": event.metadata, "pose_discrete": getattr(event, "pose_discrete", None)}
+            if frames:
+                fields["frame"] = event.frame
+                fields["third_party_camera_frames"] = list(getattr(event, "third_party_camera_frames", None) or [])
+            payload = zlib.compress(pickle.dumps(fields, protocol=pickle.HIGHEST_PROTOCOL))
+            self.events[key] = payload
+            if self._file is not None:
+                pickle.dump((state, key[1], payload), self._file, protocol=pickle.HIGHEST_PROTOCOL)
+                self._file.flush()
+
+    def record_to(self, directory: str) -> str:
+        """
+        Append every new event to a file of this process in `directory`.
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.trace")
+        self._file = open(path, "ab")
+        return path
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @classmethod
+    def load(cls, directory: str) -> "ControllerTrace":
+        """
+        Merge every trace file in `directory`; requests recorded by several processes are kept once.
+        """
+        trace = cls()
+        for path in sorted(glob.glob(os.path.join(directory, "*.trace"))):
+            with open(path, "rb") as f:
+                while True:
+                    try:
+                        state, key, payload = pickle.load(f)
+                    except (EOFError, pickle.UnpicklingError):
+                        break  # end of file, or a record cut short by a killed process
+                    trace.events.setdefault((state, key), payload)
+        return trace
+
+
+class RecordingController:
+    """
+    Wraps an AI2THOR controller and adds every step()/reset() and the event it returned to a
+    ControllerTrace. Everything else is forwarded to the wrapped controller.
+    """
+
+    def __init__(self, controller, trace: ControllerTrace, scene: str, frames: bool = False):
+        self.controller = controller
+        self.trace = trace
+        self.frames = frames
+        trace.add(None, {"call": "init", "scene": scene}, controller.last_event, frames)
+
+    def step(self, action=None, **kwargs):
+        request = step_request(action, kwargs)
+        state = request_parent(self.controller.last_event, request)
+        event = self.controller.step(action, **kwargs)
+        self.trace.add(state, request, event, self.frames)
+        return event
+
+    def reset(self, *args, **kwargs):
+        event = self.controller.reset(*args, **kwargs)
+        self.trace.add(None, reset_request(args, kwargs), event, self.frames)
+        return event
+
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
+
+
+class ReplayController:
+    """
+    Serves a recorded ControllerTrace in place of an AI2THOR controller, without Unity. Every request
+    must have been recorded in the same state; anything else raises TraceMiss.
+    """
+
+    # Episodes on a replayed controller start from a reset, never from a restored snapshot: the requests
+    # that restore a snapshot depend on where the previous episode ended, which the recording may never
+    # have visited when episodes are replayed in another order.
+    snapshot_restore = False
+
+    def __init__(self, trace: ControllerTrace, scene: str):
+        self.trace = trace
+        self.scene = scene
+        self.steps = 0
+        self.resets = 0
+        # a pooled controller may have been recorded as a reset of one launched for another scene,
+        # so the launch event is optional: then the first request has to be a reset
+        self._state = (None, {"call": "init", "scene": scene})  # request that led to the current state
+        self.last_event = trace.find(*self._state)
+        if self.last_event is None:
+            self._state = None
+
+    def step(self, action=None, **kwargs):
+        self.steps += 1
+        request = step_request(action, kwargs)
+        if self.last_event is None:
+            raise TraceMiss(f"Scene '{self.scene}' was not recorded before a reset.")
+        return self._serve(request_parent(self.last_event, request), request)
+
+    def reset(self, *args, **kwargs):
+        self.resets += 1
+        return self._serve(None, reset_request(args, kwargs))
+
+    def stop(self):
+        pass
+
+    def _serve(self, state, request):
+        event = self.trace.find(state, request)
+        if event is None:
+            raise TraceMiss(f"Request {request_key(request)} was not recorded for scene '{self.scene}' in this state.")
+        action = request.get("action")
+        if action in LAYOUT_QUERIES or (action in TELEPORTS and not event.metadata.get("lastActionSuccess")):
+            # the recorded answer may come from another agent pose: keep the current state, add the answer
+            answer = event
+            event = self.trace.find(*self._state)
+            event.metadata.update({name: answer.metadata.get(name) for name in QUERY_FIELDS})
+        else:
+            self._state = (state, request)
+        self.last_event = event
+        return event
+
+
+_default_trace = None
+_default_trace_pid = None
+_default_trace_lock = threading.Lock()
+
+
+def get_trace() -> Optional[ControllerTrace]:
+    """
+    Return the process-wide trace: loaded from PLAN_REWARD_TRACE_REPLAY, or recording into
+    PLAN_REWARD_TRACE_RECORD. None when neither is set.
+    """
+    global _default_trace, _default_trace_pid
+    with _default_trace_lock:
+        # a forked worker records into a file of its own
+        if _default_trace is None or _default_trace_pid != os.getpid():
+            _default_trace = None
+            _default_trace_pid = os.getpid()
+            replay = os.environ.get("PLAN_REWARD_TRACE_REPLAY")
+            record = os.environ.get("PLAN_REWARD_TRACE_RECORD")
+            if replay:
+                _default_trace = ControllerTrace.load(replay)
+            elif record:
+                _default_trace = ControllerTrace()
+                _default_trace.record_to(record)
+        return _default_trace
+
+
+def open_controller(scene: str, controller_factory: Callable[[str], object]):
+    """
+    Controller for `scene`: replayed from PLAN_REWARD_TRACE_REPLAY without launching Unity, recorded to
+    PLAN_REWARD_TRACE_RECORD (frames too when PLAN_REWARD_TRACE_FRAMES=1), or the factory's controller as is.
+    """
+    if os.environ.get("PLAN_REWARD_TRACE_REPLAY"):
+        return ReplayController(get_trace(), scene)
+    controller = controller_factory(scene)
+    if os.environ.get("PLAN_REWARD_TRACE_RECORD"):
+        frames = os.environ.get("PLAN_REWARD_TRACE_FRAMES", "0") == "1"
+        return RecordingController(controller, get_trace(), scene, frames)
+    return controller
@@ -17,79 +17,245 @@ if project_root3 not in sys.path:
 # These imports should work if you run the script within your project structure.
 # Mocks are provided at the end for standalone testing.
 from embodied_reasoner.evaluate.ai2thor_engine.RocAgent import RocAgent
-from ai2thor.controller import Controller
+from embodied_reasoner.evaluate.ai2thor_engine import navigability
 from embodied_reasoner.api_keys_config import QWEN_API_KEY
+from plan_validator import split_decision, get_scene_catalog
+from rollout_watchdog import WatchdogController, RolloutTimeout, stop_in_background
+from controller_pool import default_controller_factory
+from controller_trace import open_controller
+from telemetry import PhaseTimer, telemetry_path
+
+def check_plan_group(env_config, plans, controller_pool=None):
+    """
+    Check a group of plans sharing one env_config with a prefix-sharing rollout.
+    If the group rollout fails, every plan is re-checked on its own so that one bad plan only fails itself.
+    """
+    try:
+        env_checker = EnvChecker(env_config, controller_pool=controller_pool)
+    except RolloutTimeout as e:
+        print(f"Plan checker setup timed out: {e}")
+        return [e.info() for _ in plans]
+    try:
+        return env_checker.check_group(plans)
+    except Exception:
+        if len(plans) == 1:
+            raise
+    finally:
+        env_checker.close()
+    return [check_plan_group(env_config, [plan], controller_pool)[0] for plan in plans]
+
+
+class _PlanTrieNode:
+    def __init__(self):
+        self.children = {} # decision_making -> _PlanTrieNode, in first-seen order
+        self.plans = [] # indices of the plans that end at this node
+    
+    def all_plans(self):
+        plans = list(self.plans)
+        for child in self.children.values():
+            plans.extend(child.all_plans())
+        return plans
+
 
 class EnvChecker:
-    def __init__(self, env_config=None):
+    def __init__(self, env_config=None, controller_pool=None, action_timeout=None, episode_timeout=None):
         self.max_steps = env_config.get('max_steps', 20)
         self.task = env_config.get('task', {})
-        controller = Controller(
-            scene=env_config.get('scene', 'FloorPlan203'),
-            gridSize=0.25,
-            width=640,
-            height=480,
-            fieldOfView=90,
-            renderDepthImage=True
-        )
-        self.agent = RocAgent(
-            controller=controller, 
-            save_path=None,
-            scene=env_config.get('scene', 'FloorPlan203'),
-            visibilityDistance=1.5,
-            gridSize=0.25, 
-            fieldOfView=90,
-            target_objects=env_config.get("target_objects", ["RemoteControl|1", "CoffeeTable|1"]), 
-            related_objects=env_config.get("related_objects", ["CoffeeTable|1"]),
-            navigable_objects=env_config.get("navigable_objects", ["CounterTop", "Sink", "Fridge", "DiningTable", "Chair", "CoffeeTable", "Sofa", "TVStand"]),
-            taskid=env_config.get("task_id", "0"),
-            platform_type=env_config.get("platform_type", "GPU")
-        )
+        scene = env_config.get('scene', 'FloorPlan203')
+        # phase timings for PLAN_REWARD_TELEMETRY, free when it is unset
+        self.telemetry = PhaseTimer(telemetry_path() is not None)
+        # lease a warm controller from the pool when one is given, otherwise launch a private one
+        with self.telemetry.phase("lease"):
+            self.lease = controller_pool.lease(scene) if controller_pool is not None else None
+        if self.lease is not None:
+            controller = self.lease.controller
+        else:
+            with self.telemetry.phase("controller_start"):
+                controller = open_controller(scene, default_controller_factory)
+        # every simulator call runs under a deadline (seconds, 0 disables): a hung Unity fails the rollout instead of the trainer
+        if action_timeout is None:
+            action_timeout = float(os.environ.get("PLAN_REWARD_ACTION_TIMEOUT", "60"))
+        if episode_timeout is None:
+            episode_timeout = float(os.environ.get("PLAN_REWARD_EPISODE_TIMEOUT", "300"))
+        controller = self.watchdog = WatchdogController(controller, action_timeout, episode_timeout)
+        # a warm controller is put back to the scene start from the snapshot taken on its first episode
+        # (a replayed one is reset instead, see ReplayController.snapshot_restore)
+        initial_state = None
+        if self.lease is not None and self.lease.warm and getattr(self.lease.controller, "snapshot_restore", True):
+            initial_state = self.lease.state.get("scene_start")
+        try:
+            with self.telemetry.phase("agent_init"):
+                self.agent = RocAgent(
+                    controller=controller, 
+                    save_path=None,
+                    scene=scene,
+                    visibilityDistance=1.5,
+                    gridSize=0.25, 
+                    fieldOfView=90,
+                    target_objects=env_config.get("target_objects", ["RemoteControl|1", "CoffeeTable|1"]), 
+                    related_objects=env_config.get("related_objects", ["CoffeeTable|1"]),
+                    navigable_objects=env_config.get("navigable_objects", ["CounterTop", "Sink", "Fridge", "DiningTable", "Chair", "CoffeeTable", "Sofa", "TVStand"]),
+                    taskid=env_config.get("task_id", "0"),
+                    platform_type=env_config.get("platform_type", "GPU"),
+                    initial_state=initial_state,
+                    metadata_only=True # rewards only read metadata, skip frame capture
+                )
+            if self.lease is not None and initial_state is None:
+                self.lease.state["scene_start"] = self.agent.snapshot()
+            get_scene_catalog().learn(scene, self.agent.controller.last_event.metadata["objects"])
+        except Exception:
+            self._close_controller(controller, broken=True)
+            raise
+        self.closed = False
         
         # tool variables
         self.metadata = None
         self.event = None
         self.navigable_list = []
+        self.navigable_index = {} # objectId -> item of navigable_list
+        self.navigable_event = None # last event counted in navigable_list
     
     def check(self, plan):
         """
         Check if the plan can be executed in the environment.
         This method should be implemented to interact with the AI2THOR environment.
         """
-        info = {}
-        info["step"] = 0
-        info["success"] = False
+        return self.check_group([plan])[0]
+    
+    def check_group(self, plans):
+        """
+        Check a group of plans (e.g. the completions of one GRPO group) in a single episode.
+        The plans are merged into a trie: every shared prefix is executed once, the scene and
+        reward state are snapshotted at each branch point and every branch restarts from there.
+        Returns one info per plan, identical to what check() would return for it alone.
+        """
+        self.group_stats = {"plan_steps": 0, "executed_steps": 0}
+        self.watchdog.start_episode(len(plans))
+        try:
+            infos = self._run_group(plans)
+        except Exception:
+            self.close(broken=True)
+            raise
+        self.close()
+        if self.telemetry.enabled:
+            for info in infos:
+                info["telemetry"] = self.telemetry_record(len(plans))
+        return infos
+    
+    def telemetry_record(self, group_size):
+        """
+        Cost of this checker shared evenly by the `group_size` plans it rolled out together.
+        """
+        return {
+            "phases": {name: seconds / group_size for name, seconds in self.telemetry.seconds.items()},
+            "phase_calls": dict(self.telemetry.counts),
+            "sim_steps": self.watchdog.steps / group_size,
+            "sim_resets": self.watchdog.resets / group_size,
+            "group_size": group_size,
+            "warm": self.lease.warm if self.lease is not None else False,
+        }
+    
+    def close(self, broken=False):
+        """
+        Hand the controller back to the pool (or stop it when it is private). Safe to call twice.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self._close_controller(self.agent.controller, broken=broken)
+    
+    def _close_controller(self, controller, broken=False):
+        # a controller that missed a deadline may still be busy: drop it without waiting for it to quit
+        hung = self.watchdog.hung
+        self.watchdog.close()
+        if self.lease is not None:
+            self.lease.release(broken=broken or hung, wait=not hung)
+        elif hung:
+            stop_in_background(self.watchdog.controller)
+        else:
+            controller.stop()
+    
+    def _run_group(self, plans):
+        root = _PlanTrieNode()
+        for i, plan in enumerate(plans):
+            node = root
+            for decision_making in plan[:self.max_steps]:
+                node = node.children.setdefault(decision_making, _PlanTrieNode())
+            node.plans.append(i)
+        
+        infos = [None] * len(plans)
+        try:
+            with self.telemetry.phase("begin_episode"):
+                self._begin_episode()
+            self._rollout(root, 0, {"step": 0, "success": False}, infos)
+        except RolloutTimeout as e:
+            # plans finished before the deadline keep their result, the rest fail with the reason code
+            print(f"Plan rollout timed out: {e}")
+            infos = [info if info is not None else e.info() for info in infos]
+        return infos
+    
+    def _rollout(self, node, depth, info, infos):
+        # `info` describes the episode after executing the `depth` steps leading to `node`
+        for i in node.plans: # plans that run out of steps here
+            infos[i] = dict(info)
+            self.group_stats["plan_steps"] += depth
         
+        children = list(node.children.items())
+        snapshot = None
+        if len(children) > 1:
+            with self.telemetry.phase("snapshot"):
+                snapshot = self._snapshot()
+        for n, (decision_making, child) in enumerate(children):
+            if n > 0:
+                with self.telemetry.phase("restore"):
+                    self._restore(snapshot)
+            child_info = dict(info)
+            if self._step(depth, decision_making, child_info): # episode over for the whole subtree
+                for i in child.all_plans():
+                    infos[i] = dict(child_info)
+                    self.group_stats["plan_steps"] += depth + 1
+            else:
+                self._rollout(child, depth + 1, child_info, infos)
+    
+    def _begin_episode(self):
         # first initialize the agent in the corner and then observe the environment
         self.reward = 0
         self.wrong_time = 0
+        self.plan_end = False
         action_result = self.agent.init_agent_corner()
         action_result = self.agent.observe()
-        
-        for step in range(self.max_steps):
+        self.update()
+    
+    def _step(self, step, decision_making, info):
+        """
+        Execute one plan step and update `info`. Returns True when the episode is over.
+        """
+        self.group_stats["executed_steps"] += 1
+        with self.telemetry.phase("update"):
             self.update()
-            
-            # get action and objectID
-            decision_making = plan[step]
-            action, object_name = self.split_decision(decision_making)
-            if object_name is None:
-                objectId = None
-            else:
-                objectType = object_name
-                match_ids = [
-                    obj['objectId']
-                    for obj in self.event.metadata['objects']
-                    if obj['objectType'] == objectType
-                ]
-                if len(match_ids) >= 2:
-                    print(f"More than 1 object found with type '{objectType}'")
-                    continue
-                elif len(match_ids) == 0:
-                    print(f"No object found with type '{objectType}'")
-                    continue
-                objectId = match_ids[0]
+        
+        # get action and objectID
+        action, object_name = self.split_decision(decision_making)
+        if object_name is None:
+            objectId = None
+        else:
+            objectType = object_name
+            match_ids = [
+                obj['objectId']
+                for obj in self.event.metadata['objects']
+                if obj['objectType'] == objectType
+            ]
+            if len(match_ids) >= 2:
+                print(f"More than 1 object found with type '{objectType}'")
+                return False
+            elif len(match_ids) == 0:
+                print(f"No object found with type '{objectType}'")
+                return False
+            objectId = match_ids[0]
 
-            # analyze the action and object
+        # analyze the action and object
+        with self.telemetry.phase(f"action:{action}"):
+            action_result = None
             if action == "end": # Task marked as 'end' by the model
                 self.plan_end = True
             elif action == "observe":
@@ -115,150 +281,82 @@ class EnvChecker:
             else:
                 print(f"Action '{action}' requires an object, but none was provided. Defaulting to 'observe'.")
                 action_result = self.agent.observe()
-            
-            # check if the task is successful
-            image_fp, legal_navigations, legal_interactions = action_result
+        
+        # check if the task is successful
+        with self.telemetry.phase("round_reward"):
             reward, success, feedback = self.round_reward(
                 objectId=objectId,
                 decisionmaking=decision_making,
             )
-            
+        
+        with self.telemetry.phase("update"):
             self.update()
-            info["success"] = info["success"] | success
-            info["step"] = step
-            
-            if info["success"] or self.plan_end: # stop control
-                self.agent.controller.stop()
-                break
+        info["success"] = info["success"] | success
+        info["step"] = step
         
-        return info
+        return info["success"] or self.plan_end # stop control
+    
+    ### prefix-sharing rollout state ###
+    
+    REWARD_STATE = ("reward", "wrong_time", "plan_end", "current_action", "next_action", "plan_objects_list", "navigable_list")
+    AGENT_STATE = ("navigable_objects", "legal_interactions", "current_container", "step_count")
+    
+    def _snapshot(self):
+        return {
+            "reward_state": {name: copy.deepcopy(getattr(self, name)) for name in self.REWARD_STATE if hasattr(self, name)},
+            "agent_state": {name: copy.deepcopy(getattr(self.agent, name)) for name in self.AGENT_STATE},
+            "scene": self.agent.snapshot(),
+        }
+    
+    def _restore(self, snapshot):
+        self.agent.restore(snapshot["scene"])
+        for name, value in snapshot["reward_state"].items():
+            setattr(self, name, copy.deepcopy(value))
+        for name, value in snapshot["agent_state"].items():
+            setattr(self.agent, name, copy.deepcopy(value))
+        # the restored list already counts the scene as seen from the snapshot pose
+        self.navigable_index = {item["objectId"]: item for item in self.navigable_list}
+        self.navigable_event = self.agent.controller.last_event
+        self.update()
     
     def split_decision(self, decision_making):
         """
         Split the decision making string into action and object.
         """
-        decision_making = decision_making.strip()
-        if decision_making.startswith("end"):
-            return "end", None
-        elif decision_making.startswith("observe"):
-            return "observe", None
-        elif decision_making.startswith("move forward"):
-            return "move forward", None
-        elif decision_making.startswith("navigate to"):
-            object_name = decision_making[len("navigate to "):].strip()
-            return "navigate to", object_name
-        elif decision_making.startswith("pickup"):
-            object_name = decision_making[len("pickup "):].strip()
-            return "pickup", object_name
-        elif decision_making.startswith("put in"):
-            object_name = decision_making[len("put in "):].strip()
-            return "put in", object_name
-        elif decision_making.startswith("toggle"):
-            object_name = decision_making[len("toggle "):].strip()
-            return "toggle", object_name
-        elif decision_making.startswith("open"):
-            object_name = decision_making[len("open "):].strip()
-            return "open", object_name
-        elif decision_making.startswith("close"):
-            object_name = decision_making[len("close "):].strip()
-            return "close", object_name
-        else:
-            print(f"Unknown decision making: '{decision_making}'. Defaulting to 'observe'.")
+        action, object_name = split_decision(decision_making)
+        if action is None:
+            print(f"Unknown decision making: '{decision_making.strip()}'. Defaulting to 'observe'.")
             return "observe", None
+        return action, object_name
         
     
     ### round_reward function related methods ###
     
+    @staticmethod
     def get_volume_distance_rate(metadata): # refer to data_engine/utils
-        volumes = []
-        objectid2object={}
-        for obj in metadata["objects"]:
-            objectid2object[obj["objectId"]]=obj
-            if obj["objectType"]!="Floor":
-                size=obj["axisAlignedBoundingBox"]["size"]
-                v=size["x"]*size["y"]*size["z"]
-                dx=obj["axisAlignedBoundingBox"]["center"]["x"]
-                dz=obj["axisAlignedBoundingBox"]["center"]["z"]
-                agentx=metadata["agent"]["position"]["x"]
-                agentz=metadata["agent"]["position"]["z"]
-                d=math.sqrt((dx-agentx)**2+(dz-agentz)**2)
-
-                sxz = size["x"] * size["z"]
-                sxy = size["x"] * size["y"]
-                szy = size["y"] * size["z"]
-                s = max(sxz, sxy, szy)
-                if d != 0: 
-                    rate = v / d
-                else:
-                    rate = 0 
-                rate=v/d
-                isnavigable=False
-                if obj["visible"]==True:
-                    if v<0.01:
-                        isnavigable=False
-                        if s>0.5 and d<10:
-                            isnavigable=True
-                        elif s>0.15 and d<4:
-                            isnavigable=True
-                        elif s>0.08 and d<2.5:
-                            isnavigable=True 
-                        elif v>0.005 and d<2:
-                            isnavigable=True 
-                        elif v>0.001 and d<1.5:
-                            isnavigable=True
-                        elif d<1:
-                            isnavigable=True
-                    else:
-                        isnavigable=True
-                        if rate<=0.02:
-                            isnavigable=False
-                            if s>0.5 and d<10:
-                                isnavigable=True
-                            elif s>0.15 and d<4:
-                                isnavigable=True
-                            elif s>0.08 and d<2.5:
-                                isnavigable=True 
-                            elif v>0.005 and d<2:
-                                isnavigable=True 
-                            elif v>0.001 and d<1.5:
-                                isnavigable=True
-                            elif d<1:
-                                isnavigable=True                        
-                volumes.append({
-                    "objectId":obj["objectId"],
-                    "objectType":obj["objectType"],
-                    "visible":obj["visible"],
-                    "volume":v,
-                    "s":s,
-                    "distance":d,
-                    "rate":rate,
-                    "isnavigable":isnavigable
-                })
-                sorted_volumes = sorted(volumes, key=lambda v: v["rate"])
-
-        # save_data_to_json(sorted_volumes,"./test/navigable_list.json")
-        return sorted_volumes
+        return navigability.get_volume_distance_rate(metadata)
     
     def update_navigable_list_vtime(self): # refer to o1StyleGenerate
-        self.metadata=self.agent.controller.last_event.metadata
-        list = self.get_volume_distance_rate(self.metadata)
-        for item in list:
-            if item["isnavigable"]:  
-                found = False
-                for last_item in self.navigable_list:
-                    if last_item["objectId"] == item["objectId"]:
-                        last_item["visibleTimes"] += 1
-                        found = True
-                        break
-                    
-                if not found:
-                    new_item = {
-                        "objectType": item["objectType"],
-                        "objectId": item["objectId"],
-                        "visibleTimes": 1,
-                        "choseTimes": 0
-                    }
-                    self.navigable_list.append(new_item)
+        event = self.agent.controller.last_event
+        if event is self.navigable_event: # each event is counted once, however often update() runs
+            return self.navigable_list
+        self.navigable_event = event
+        self.metadata = event.metadata
+        table = navigability.event_navigability(event) # shared with the agent's legal sets for this event
+        for i in navigability.navigable_indices(table):
+            objectId = table["objectId"][i]
+            last_item = self.navigable_index.get(objectId)
+            if last_item is not None:
+                last_item["visibleTimes"] += 1
+            else:
+                new_item = {
+                    "objectType": table["objectType"][i],
+                    "objectId": objectId,
+                    "visibleTimes": 1,
+                    "choseTimes": 0
+                }
+                self.navigable_list.append(new_item)
+                self.navigable_index[objectId] = new_item
                                 
         # print("update",self.navigable_list)
         # path=f"nvrecord/{self.origin_path}/update_navigable_list.json"
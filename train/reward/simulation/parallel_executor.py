@@ -0,0 +1,179 @@
+import atexit
+import threading
+import multiprocessing as mp
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Dict, List, Sequence, Tuple
+
+from plan_validator import get_scene_catalog
+
+
+def _worker_main(conn):
+    """
+    Worker loop: owns a single controller for its whole life and checks one group of plans at a time.
+    """
+    from env_checker import check_plan_group
+    from controller_pool import ControllerPool
+
+    pool = ControllerPool(max_size=1, max_idle_per_scene=1, idle_timeout=None)
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            if message is None:
+                break
+            job_id, plans, env_config = message
+            try:
+                infos = check_plan_group(env_config, plans, controller_pool=pool)
+            except Exception as e:
+                infos = [{"step": 0, "success": False, "error": repr(e)} for _ in plans]
+            # scenes seen for the first time go back with the result so the parent can pre-validate plans for them
+            conn.send((job_id, infos, get_scene_catalog().take_learned()))
+    finally:
+        pool.shutdown()
+        conn.close()
+
+
+class _Worker:
+    def __init__(self, ctx, index):
+        self.index = index
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), name=f"plan-reward-worker-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.job = None  # (group index, plan indices) currently running on this worker
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=10)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class PlanWorkerPool:
+    """
+    Runs EnvChecker.check on N long-lived worker processes, each owning its own AI2THOR controller.
+
+    Results come back in input order. A worker that dies mid-episode (Unity crash, segfault, OOM kill)
+    only fails the job it was running; it is replaced by a fresh worker and the rest of the batch continues.
+    Several threads may call check_groups at once; each takes free workers as they become idle.
+    """
+
+    def __init__(self, num_workers: int = 4, start_method: str = "spawn"):
+        assert num_workers > 0, "At least one worker is required."
+        self.num_workers = num_workers
+        self.ctx = mp.get_context(start_method)
+        self.workers = [_Worker(self.ctx, i) for i in range(num_workers)]
+        self._idle = threading.Condition()  # guards worker.job and self.workers, notified when a worker frees up
+        self.crashes = 0
+        self.closed = False
+
+    def check_all(self, jobs: Sequence[Tuple[List[str], Dict]]) -> List[Dict]:
+        """
+        Check every (plan, env_config) pair and return the info dicts in the same order.
+        """
+        return [infos[0] for infos in self.check_groups([([plan], env_config) for plan, env_config in jobs])]
+
+    def check_groups(self, groups: Sequence[Tuple[List[List[str]], Dict]]) -> List[List[Dict]]:
+        """
+        Check every (plans, env_config) group with EnvChecker.check_group and return the infos in the same order.
+        When a worker dies on a group, its plans are retried one by one so that only the plan that
+        crashes the simulator is failed.
+        """
+        assert not self.closed, "The worker pool has been closed."
+        results = [[None] * len(plans) for plans, _ in groups]
+        pending = deque((g, list(range(len(plans)))) for g, (plans, _) in enumerate(groups))
+        busy = []  # workers running a job of this call
+        while pending or busy:
+            with self._idle:
+                # with nothing of our own running, wait for a worker that another call is using
+                while pending and not busy and all(worker.job is not None for worker in self.workers):
+                    self._idle.wait()
+                for worker in list(self.workers):
+                    if worker.job is None and pending:
+                        job = pending.popleft()
+                        group, members = job
+                        plans, env_config = groups[group]
+                        try:
+                            worker.conn.send((group, [plans[i] for i in members], env_config))
+                            worker.job = job
+                            busy.append(worker)
+                        except (BrokenPipeError, OSError):
+                            pending.appendleft(job)
+                            self._replace(worker)
+            if not busy:
+                continue
+
+            ready = wait([worker.conn for worker in busy] + [worker.process.sentinel for worker in busy])
+            for worker in list(busy):
+                if worker.conn in ready:
+                    try:
+                        _, infos, scenes = worker.conn.recv()
+                    except (EOFError, OSError):
+                        busy.remove(worker)
+                        self._fail(worker, results, pending)
+                        continue
+                    get_scene_catalog().update(scenes)
+                    group, members = worker.job
+                    for i, info in zip(members, infos):
+                        results[group][i] = info
+                    busy.remove(worker)
+                    with self._idle:
+                        worker.job = None
+                        self._idle.notify_all()
+                elif worker.process.sentinel in ready:
+                    busy.remove(worker)
+                    self._fail(worker, results, pending)
+        return results
+
+    def _fail(self, worker, results, pending):
+        self.crashes += 1
+        worker.process.join(timeout=1)
+        group, members = worker.job
+        print(f"Plan reward worker {worker.index} died while checking group {group}, restarting it.")
+        if len(members) > 1:
+            pending.extend((group, [i]) for i in members)
+        else:
+            results[group][members[0]] = {
+                "step": 0,
+                "success": False,
+                "error": f"worker {worker.index} died (exit code {worker.process.exitcode})",
+            }
+        with self._idle:
+            worker.job = None
+            self._replace(worker)
+
+    def _replace(self, worker):
+        # called with self._idle held
+        worker.stop()
+        self.workers[self.workers.index(worker)] = _Worker(self.ctx, worker.index)
+        self._idle.notify_all()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        for worker in self.workers:
+            worker.stop()
+
+
+_default_worker_pool = None
+
+
+def get_worker_pool(num_workers: int) -> PlanWorkerPool:
+    """
+    Return the process-wide worker pool, started on first use.
+    """
+    global _default_worker_pool
+    if _default_worker_pool is None or _default_worker_pool.num_workers != num_workers:
+        if _default_worker_pool is not None:
+            _default_worker_pool.close()
+        _default_worker_pool = PlanWorkerPool(num_workers)
+        atexit.register(_default_worker_pool.close)
+    return _default_worker_pool
@@ -1,11 +1,14 @@
 import os
 import re
+import time
 import warnings
 import json
 from typing import Dict, List, Union, Optional
 
 from swift.plugin.orm import ORM
-from env_checker import EnvChecker
+from plan_checker import PlanChecker
+from reward_server import RemotePlanChecker
+from telemetry import get_telemetry
 
 # Global dictionary for registering reward functions
 orms = {}
@@ -26,13 +29,20 @@ class PlanAccuracy(ORM):
     #     r'\]'
     # )
 
-    def __init__(self):
+    def __init__(self, controller_pool=None, num_workers=None):
         """
         Initialize the plan accuracy reward function
         """
         self.format_weight = 1.0  # Weight for format correctness
         self.length_weight = 1.0  # Weight for length of the plan
         self.execution_weight = 1.0  # Weight for successful execution in the environment
+        # Simulations go to the shared reward service when PLAN_REWARD_SERVER_URL is set
+        # (see reward_server.py), otherwise they run from this process
+        server_url = os.environ.get("PLAN_REWARD_SERVER_URL")
+        if server_url:
+            self.checker = RemotePlanChecker(server_url)
+        else:
+            self.checker = PlanChecker(controller_pool=controller_pool, num_workers=num_workers)
 
     def normalize_plan(self, answer: str) -> Union[List[str], float]:
         """
@@ -76,17 +86,33 @@ class PlanAccuracy(ORM):
         """
         Call a external environment checker to determine if the plan can be executed successfully.
         """
-        env_checker = EnvChecker(env_config)
-        info = env_checker.check(plan)
-        execution_reward = 1.0 if info["success"] else 0.0
-        del env_checker  # Clean up to free resources
-        return execution_reward
+        return self.execution_rewards([(plan, env_config)])[0]
+
+    def execution_rewards(self, jobs: List[tuple]) -> List[float]:
+        """
+        Execution rewards for a batch of (plan, env_config) pairs, in input order.
+        """
+        return self.rewards_from_infos(self.check_plans(jobs))
+
+    def rewards_from_infos(self, infos: List[Dict]) -> List[float]:
+        for info in infos:
+            if "error" in info:
+                print(f"Plan execution failed: {info['error']}")
+        return [1.0 if info["success"] else 0.0 for info in infos]
+
+    def check_plans(self, jobs: List[tuple]) -> List[Dict]:
+        """
+        Checker infos for a batch of (plan, env_config) pairs, in input order.
+        """
+        return self.checker.check_plans(jobs)
 
     def __call__(self, completions, env_config, **kwargs):
         """
         Calculate the reward based on the model's plan and the expected solution.
         """
         rewards = []
+        telemetry = get_telemetry()
+        started = time.perf_counter()
 
         # Ensure both completions and env_config are lists
         if not isinstance(completions, list):
@@ -94,15 +120,20 @@ class PlanAccuracy(ORM):
         if not isinstance(env_config, list):
             env_config = [env_config]
 
+        # parse every completion first so that the simulations can run as one batch
+        parsed = [self.normalize_plan(completion) for completion in completions]
+        jobs = [(plan, env_cfg) for (plan, _), env_cfg in zip(parsed, env_config) if not isinstance(plan, str)]
+        infos = self.check_plans(jobs)
+        execution_rewards = iter(self.rewards_from_infos(infos))
+
         # calculate diffrent types of rewards for each pair
-        for completion, env_cfg in zip(completions, env_config):
-            plan, format_reward = self.normalize_plan(completion)
+        for (plan, format_reward), env_cfg in zip(parsed, env_config):
             if isinstance(plan, str):
                 rewards.append(-3.0)
                 continue
             
             length_reward = self.length_reward(plan)
-            execution_reward = self.execution_reward(plan, env_cfg)
+            execution_reward = next(execution_rewards)
             
             # Combine all rewards with their respective weights
             reward = self.format_weight * format_reward
@@ -111,8 +142,35 @@ class PlanAccuracy(ORM):
             
             rewards.append(reward)
         
+        if telemetry is not None:
+            telemetry.record_call(self.telemetry_records(parsed, infos, rewards), time.perf_counter() - started)
         return rewards
 
+    @staticmethod
+    def telemetry_records(parsed, infos, rewards) -> List[Dict]:
+        """
+        One telemetry record per completion: outcome, reward and where the execution result came from.
+        """
+        records = []
+        infos = iter(infos)
+        for i, ((plan, _), reward) in enumerate(zip(parsed, rewards)):
+            record = {"completion": i, "reward": reward}
+            if isinstance(plan, str):
+                record.update({"outcome": "unparsable", "source": "parser"})
+            else:
+                info = next(infos)
+                record.update(info.get("telemetry", {}))
+                record.setdefault("source", "unknown")
+                record["plan_steps"] = len(plan)
+                if "rejected" in info or "reason" in info:
+                    record["outcome"] = info.get("rejected") or info["reason"]
+                elif "error" in info:
+                    record["outcome"] = "error"
+                else:
+                    record["outcome"] = "success" if info["success"] else "failure"
+            records.append(record)
+        return records
+
 # Register reward function
 orms['plan_accuracy'] = PlanAccuracy
 
@@ -0,0 +1,120 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+class PlanOutcomeCache:
+    """
+    Memo of EnvChecker.check results keyed by (env_config, canonical plan).
+
+    Rollouts are deterministic for a given task and plan, so identical plans inside a GRPO group and
+    plans repeated across epochs are simulated once. The in-memory tier is an LRU of `max_entries`
+    items; when `disk_path` is given, outcomes are also kept in a SQLite file shared by every process
+    on the machine and surviving restarts.
+    """
+
+    def __init__(self, max_entries: int = 4096, disk_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_pid = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def canonical_plan(plan: List[str], max_steps: int) -> List[str]:
+        """
+        The part of the plan the checker can actually execute: at most `max_steps` steps,
+        cut after the first "end" since the rollout stops there.
+        """
+        canonical = []
+        for decision_making in plan[:max_steps]:
+            canonical.append(decision_making)
+            if isinstance(decision_making, str) and decision_making.strip().startswith("end"):
+                break
+        return canonical
+
+    @classmethod
+    def make_key(cls, plan: List[str], env_config: Dict) -> str:
+        """
+        Hash of the whole env_config (the task actions and the target, related and navigable objects all
+        drive the rollout, so task ids alone are not enough) and the canonical plan. platform_type only
+        picks the renderer and is left out.
+        """
+        config = {name: value for name, value in env_config.items() if name != "platform_type"}
+        key = [config, cls.canonical_plan(plan, env_config.get("max_steps", 20))]
+        return hashlib.sha1(json.dumps(key, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(self._memory[key])
+        info = self._disk_get(key)
+        with self._lock:
+            if info is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, info)
+        return dict(info)
+
+    def put(self, key: str, info: Dict):
+        if "error" in info:  # infrastructure failures say nothing about the plan
+            return
+        with self._lock:
+            self._remember(key, dict(info))
+        self._disk_put(key, info)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._memory),
+        }
+
+    def _remember(self, key, info):
+        self._memory[key] = info
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        # one connection per process, SQLite connections must not cross a fork
+        if self._db is None or self._db_pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.disk_path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            self._db = sqlite3.connect(self.disk_path, timeout=30, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS outcomes (key TEXT PRIMARY KEY, info TEXT)")
+            self._db.commit()
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _disk_get(self, key):
+        if self.disk_path is None:
+            return None
+        with self._lock:
+            row = self._connection().execute("SELECT info FROM outcomes WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _disk_put(self, key, info):
+        if self.disk_path is None:
+            return
+        with self._lock:
+            db = self._connection()
+            db.execute("INSERT OR REPLACE INTO outcomes (key, info) VALUES (?, ?)", (key, json.dumps(info)))
+            db.commit()
@@ -0,0 +1,136 @@
+import os
+import json
+from typing import Dict, List
+
+from env_checker import check_plan_group
+from controller_pool import get_controller_pool
+from parallel_executor import get_worker_pool
+from plan_cache import PlanOutcomeCache
+from plan_validator import PlanValidator
+from telemetry import telemetry_path
+
+
+class PlanChecker:
+    """
+    Turns (plan, env_config) pairs into EnvChecker infos: impossible plans are rejected by the
+    validator, known plans are answered from the outcome cache and the rest are simulated, grouped
+    by env_config and spread across the worker processes.
+    """
+
+    def __init__(self, controller_pool=None, num_workers=None):
+        # Warm controllers shared by every checker in this process (None launches one Unity per completion)
+        self.controller_pool = controller_pool if controller_pool is not None else get_controller_pool()
+        # Number of simulator worker processes (0 runs every check in this process)
+        self.num_workers = num_workers if num_workers is not None else int(os.environ.get("PLAN_REWARD_WORKERS", "0"))
+        # Outcomes of plans that were already simulated (PLAN_REWARD_CACHE_SIZE=0 disables it)
+        cache_size = int(os.environ.get("PLAN_REWARD_CACHE_SIZE", "4096"))
+        self.plan_cache = PlanOutcomeCache(
+            max_entries=cache_size,
+            disk_path=os.environ.get("PLAN_REWARD_CACHE_PATH"),
+        ) if cache_size > 0 else None
+        # Rejects plans that cannot succeed before any simulation
+        self.plan_validator = PlanValidator()
+        # Tag every info with where its answer came from (PLAN_REWARD_TELEMETRY)
+        self.telemetry = telemetry_path() is not None
+
+    def check_plans(self, jobs: List[tuple]) -> List[Dict]:
+        """
+        Checker infos for a batch of (plan, env_config) pairs. Plans that cannot succeed are failed
+        by the validator without touching the simulator.
+        """
+        infos = [self.plan_validator.validate(plan, env_cfg) for plan, env_cfg in jobs]
+        pending = [i for i, info in enumerate(infos) if info is None]
+        if self.telemetry:
+            for info in infos:
+                if info is not None:
+                    info["telemetry"] = {"source": "validator"}
+        for i, info in zip(pending, self.cached_checks([jobs[i] for i in pending])):
+            infos[i] = info
+        return infos
+
+    def cached_checks(self, jobs: List[tuple]) -> List[Dict]:
+        """
+        Plans already in the outcome cache are answered from it and identical plans within the batch
+        are simulated only once.
+        """
+        if self.plan_cache is None:
+            return self.run_checks(jobs)
+
+        infos = [None] * len(jobs)
+        misses = {}  # cache key -> indices of the jobs waiting for it
+        for i, (plan, env_cfg) in enumerate(jobs):
+            key = PlanOutcomeCache.make_key(plan, env_cfg)
+            if key in misses:
+                misses[key].append(i)
+                self.plan_cache.hits += 1  # answered by the simulation of its twin in this batch
+                continue
+            info = self.plan_cache.get(key)
+            if info is not None:
+                if self.telemetry:
+                    info["telemetry"] = {"source": "cache"}
+                infos[i] = info
+            else:
+                misses[key] = [i]
+
+        keys = list(misses)
+        for key, info in zip(keys, self.run_checks([jobs[misses[key][0]] for key in keys])):
+            self.plan_cache.put(key, {name: value for name, value in info.items() if name != "telemetry"})
+            for n, i in enumerate(misses[key]):
+                infos[i] = dict(info)
+                if self.telemetry and n > 0:
+                    infos[i]["telemetry"] = {"source": "duplicate"}
+        return infos
+
+    def run_checks(self, jobs: List[tuple]) -> List[Dict]:
+        """
+        Simulate every (plan, env_config) pair. Plans sharing an env_config (the completions of one
+        GRPO group) are rolled out together so that common prefixes are executed once; groups are
+        spread across the worker processes when num_workers > 0.
+        """
+        groups = {}  # env_config -> indices of its jobs
+        for i, (plan, env_cfg) in enumerate(jobs):
+            groups.setdefault(json.dumps(env_cfg, sort_keys=True, default=str), []).append(i)
+        members = list(groups.values())
+        if self.num_workers > 0:
+            members = self.split_groups(members, jobs)
+        batches = [([jobs[i][0] for i in indices], jobs[indices[0]][1]) for indices in members]
+
+        if self.num_workers > 0:
+            group_infos = get_worker_pool(self.num_workers).check_groups(batches)
+        else:
+            group_infos = [self.check_group(plans, env_cfg) for plans, env_cfg in batches]
+
+        infos = [None] * len(jobs)
+        for indices, group in zip(members, group_infos):
+            for i, info in zip(indices, group):
+                if self.telemetry:
+                    info.setdefault("telemetry", {})["source"] = "simulated"
+                infos[i] = info
+        return infos
+
+    def split_groups(self, members: List[List[int]], jobs: List[tuple]) -> List[List[int]]:
+        """
+        With fewer groups than workers (e.g. one prompt x num_generations), split the groups into
+        about num_workers parts, in proportion to their sizes, so that no worker sits idle. A split
+        group loses prefix sharing between its parts; plans are sorted first so that plans with a
+        common prefix land in the same part and still share it there.
+        """
+        if len(members) >= self.num_workers:
+            return members
+        total = sum(len(indices) for indices in members)
+        parts = []
+        for indices in members:
+            count = max(1, min(len(indices), round(self.num_workers * len(indices) / total)))
+            indices = sorted(indices, key=lambda i: json.dumps(jobs[i][0], default=str))
+            size = -(-len(indices) // count)
+            parts.extend(indices[start:start + size] for start in range(0, len(indices), size))
+        return parts
+
+    def check_group(self, plans: List[List[str]], env_config: Dict) -> List[Dict]:
+        return check_plan_group(env_config, plans, controller_pool=self.controller_pool)
+
+    def stats(self) -> Dict:
+        return {
+            "validator": self.plan_validator.stats(),
+            "cache": self.plan_cache.stats() if self.plan_cache is not None else None,
+        }
@@ -0,0 +1,173 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# verbs that take an object, in the order EnvChecker.split_decision tries them
+OBJECT_ACTIONS = ("navigate to", "pickup", "put in", "toggle", "open", "close")
+# the only steps on which EnvChecker.round_reward can report success
+END_STEPS = ("end", "End")
+
+
+def split_decision(decision_making: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Split a plan step into (action, object). Returns (None, None) for steps the checker does not understand.
+    """
+    decision_making = decision_making.strip()
+    if decision_making.startswith("end"):
+        return "end", None
+    elif decision_making.startswith("observe"):
+        return "observe", None
+    elif decision_making.startswith("move forward"):
+        return "move forward", None
+    for action in OBJECT_ACTIONS:
+        if decision_making.startswith(action):
+            return action, decision_making[len(action) + 1:].strip()
+    return None, None
+
+
+class SceneCatalog:
+    """
+    Number of objects of each type in every known scene.
+
+    Scenes are loaded from the JSON file at `path` ({scene: {objectType: count}}) and learned from the
+    first episode simulated in them. Object types never appear or disappear during a plan, so the counts
+    taken at the start of an episode hold for every step. Learned scenes are written back to `path` and
+    can be drained with `take_learned()` to hand them to another process.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._scenes = {}
+        self._learned = {}
+        self._lock = threading.Lock()
+        self._mtime = None
+
+    def get(self, scene: str) -> Optional[Dict[str, int]]:
+        with self._lock:
+            if scene not in self._scenes:
+                self._load()
+            return self._scenes.get(scene)
+
+    def learn(self, scene: str, objects: List[Dict]):
+        """
+        Record the object types of `scene` from the metadata of an episode start.
+        """
+        with self._lock:
+            if scene in self._scenes:
+                return
+            counts = {}
+            for obj in objects:
+                counts[obj["objectType"]] = counts.get(obj["objectType"], 0) + 1
+            self._scenes[scene] = counts
+            self._learned[scene] = counts
+            self._save()
+
+    def update(self, scenes: Dict[str, Dict[str, int]]):
+        """
+        Merge scenes learned elsewhere (e.g. in a worker process).
+        """
+        with self._lock:
+            new = {scene: counts for scene, counts in scenes.items() if scene not in self._scenes}
+            if new:
+                self._scenes.update(new)
+                self._save()
+
+    def take_learned(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            learned, self._learned = self._learned, {}
+        return learned
+
+    def _load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime:
+            return
+        with open(self.path) as f:
+            scenes = json.load(f)
+        for scene, counts in scenes.items():
+            self._scenes.setdefault(scene, counts)
+        self._mtime = mtime
+
+    def _save(self):
+        if self.path is None:
+            return
+        self._load()  # keep scenes other processes added since the last read
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._scenes, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._mtime = os.path.getmtime(self.path)
+
+
+class PlanValidator:
+    """
+    Rejects plans that cannot succeed in EnvChecker without running the simulator.
+
+    A rollout only succeeds on an exact "end"/"End" step reached before the episode stops, and only
+    after an earlier step named an object type that exists exactly once in the scene (steps naming a
+    missing or ambiguous type are skipped by the checker). Plans breaking either rule get a definite
+    failure; everything else is left to the simulator. Without a catalog entry for the scene any step
+    naming an object counts.
+    """
+
+    def __init__(self, catalog: Optional[SceneCatalog] = None):
+        self.catalog = catalog if catalog is not None else get_scene_catalog()
+        self.checked = 0
+        self.rejected = 0
+        self.reasons = {}
+
+    def validate(self, plan: List[str], env_config: Dict) -> Optional[Dict]:
+        """
+        Return a failed checker info when the plan cannot succeed, None when it has to be simulated.
+        """
+        self.checked += 1
+        reason = self.reject_reason(plan, env_config)
+        if reason is None:
+            return None
+        self.rejected += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        return {"step": 0, "success": False, "rejected": reason}
+
+    def reject_reason(self, plan: List[str], env_config: Dict) -> Optional[str]:
+        object_types = self.catalog.get(env_config.get("scene", "FloorPlan203"))
+        found_object = False  # a step so far named an object the checker can resolve
+        has_end = False
+        for decision_making in plan[:env_config.get("max_steps", 20)]:
+            if not isinstance(decision_making, str):
+                return "malformed_step"
+            if decision_making in END_STEPS:
+                if found_object:
+                    return None
+                has_end = True
+            action, object_name = split_decision(decision_making)
+            if action == "end":  # the episode stops here
+                break
+            if action in OBJECT_ACTIONS and object_name:
+                found_object |= object_types is None or object_types.get(object_name, 0) == 1
+        return "no_unique_object" if has_end else "no_end"
+
+    def stats(self) -> Dict:
+        return {
+            "checked": self.checked,
+            "rejected": self.rejected,
+            "reject_rate": self.rejected / self.checked if self.checked else 0.0,
+            "reasons": dict(self.reasons),
+        }
+
+
+_default_catalog = None
+
+
+def get_scene_catalog() -> SceneCatalog:
+    """
+    Return the process-wide scene catalog, backed by the file at PLAN_REWARD_SCENE_CATALOG when it is set.
+    """
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = SceneCatalog(os.environ.get("PLAN_REWARD_SCENE_CATALOG"))
+    return _default_catalog
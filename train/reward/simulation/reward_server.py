@@ -0,0 +1,220 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+class _PendingRequest:
+    """
+    One client's plans; its future resolves as soon as every one of them has an info.
+    """
+
+    def __init__(self, jobs: List[tuple]):
+        self.jobs = jobs
+        self.future = Future()
+        self.infos = [None] * len(jobs)
+        self.remaining = len(jobs)
+        self._lock = threading.Lock()
+        if not jobs:
+            self.future.set_result([])
+
+    def set_info(self, index: int, info: Dict):
+        with self._lock:
+            self.infos[index] = info
+            self.remaining -= 1
+            if self.remaining == 0 and not self.future.done():
+                self.future.set_result(self.infos)
+
+    def set_exception(self, error: BaseException):
+        with self._lock:
+            if not self.future.done():
+                self.future.set_exception(error)
+
+
+class BatchingService:
+    """
+    Coalesces check requests from many clients for one PlanChecker.
+
+    The first pending request opens a batch; requests arriving within `batch_window` seconds join it,
+    up to `max_batch` plans. A batch is split into its env_config groups (completions of one prompt
+    from every client are rolled out together) and the groups run on `max_concurrent` threads, so a
+    new batch starts as soon as capacity is free instead of waiting for the previous one. Each
+    request resolves as soon as its own groups are done, not when the whole batch is.
+    """
+
+    def __init__(self, checker, batch_window: float = 0.05, max_batch: int = 1024, max_concurrent: int = None):
+        self.checker = checker
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        # one group per simulator worker by default; the worker pool shares its workers between the groups
+        self.max_concurrent = max_concurrent or getattr(checker, "num_workers", 0) or 1
+        self._executor = ThreadPoolExecutor(self.max_concurrent, thread_name_prefix="plan-reward-group")
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="plan-reward-batcher", daemon=True)
+        self._thread.start()
+
+        self.requests = 0
+        self.batches = 0
+        self.groups = 0
+        self.jobs = 0
+
+    def submit(self, jobs: List[tuple]) -> Future:
+        request = _PendingRequest(list(jobs))
+        if request.jobs:
+            self._queue.put(request)
+        return request.future
+
+    def check_plans(self, jobs: List[tuple]) -> List[Dict]:
+        return self.submit(jobs).result()
+
+    def stats(self) -> Dict:
+        stats = self.checker.stats()
+        stats.update({
+            "requests": self.requests,
+            "batches": self.batches,
+            "groups": self.groups,
+            "jobs": self.jobs,
+            "mean_batch": self.jobs / self.batches if self.batches else 0.0,
+        })
+        return stats
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].jobs)
+        deadline = time.monotonic() + self.batch_window
+        while size < self.max_batch:
+            try:
+                request = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.jobs)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            groups = {}  # env_config -> (request, index) of its plans
+            for request in batch:
+                for i, (_, env_config) in enumerate(request.jobs):
+                    groups.setdefault(json.dumps(env_config, sort_keys=True, default=str), []).append((request, i))
+            self.requests += len(batch)
+            self.batches += 1
+            self.groups += len(groups)
+            self.jobs += sum(len(request.jobs) for request in batch)
+            for members in groups.values():
+                self._executor.submit(self._run_group, members)
+
+    def _run_group(self, members):
+        try:
+            infos = self.checker.check_plans([request.jobs[i] for request, i in members])
+        except Exception as e:
+            for request, _ in members:
+                request.set_exception(e)
+            return
+        for (request, i), info in zip(members, infos):
+            request.set_info(i, info)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """
+    POST /check {"jobs": [[plan, env_config], ...]} -> {"infos": [...]}
+    GET /stats -> validator, cache and batching counters
+    """
+
+    def do_POST(self):
+        if self.path != "/check":
+            return self._send(404, {"error": f"unknown path {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            jobs = [(plan, env_config) for plan, env_config in body["jobs"]]
+            infos = self.server.service.check_plans(jobs)
+        except Exception as e:
+            return self._send(500, {"error": repr(e)})
+        self._send(200, {"infos": infos})
+
+    def do_GET(self):
+        if self.path != "/stats":
+            return self._send(404, {"error": f"unknown path {self.path}"})
+        self._send(200, self.server.service.stats())
+
+    def _send(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(checker, host: str = "127.0.0.1", port: int = 8765, batch_window: float = 0.05, max_batch: int = 1024,
+          max_concurrent: int = None) -> ThreadingHTTPServer:
+    """
+    Start the reward service on a background thread and return the server (call shutdown() to stop it).
+    """
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = BatchingService(checker, batch_window=batch_window, max_batch=max_batch, max_concurrent=max_concurrent)
+    threading.Thread(target=server.serve_forever, name="plan-reward-server", daemon=True).start()
+    return server
+
+
+class RemotePlanChecker:
+    """
+    Client side of the reward service, a drop-in replacement for PlanChecker.check_plans.
+    submit() sends the request in the background and returns a Future of the infos.
+    """
+
+    def __init__(self, url: str, timeout: float = 3600.0, max_requests: int = 4):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_requests, thread_name_prefix="plan-reward-client")
+
+    def submit(self, jobs: List[tuple]) -> Future:
+        return self._executor.submit(self.check_plans, jobs)
+
+    def check_plans(self, jobs: List[tuple]) -> List[Dict]:
+        if not jobs:
+            return []
+        data = json.dumps({"jobs": [[plan, env_config] for plan, env_config in jobs]}, ensure_ascii=False, default=str).encode("utf-8")
+        request = urllib.request.Request(f"{self.url}/check", data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())["infos"]
+
+    def stats(self) -> Dict:
+        with urllib.request.urlopen(f"{self.url}/stats", timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve plan_accuracy simulations to the trainer ranks on this machine.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("PLAN_REWARD_WORKERS", "4")),
+                        help="simulator worker processes")
+    parser.add_argument("--batch-window", type=float, default=0.05,
+                        help="seconds to wait for more requests before starting a batch")
+    parser.add_argument("--max-batch", type=int, default=1024, help="maximum number of plans in one batch")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="env_config groups simulated at once (default: one per worker)")
+    args = parser.parse_args()
+
+    from plan_checker import PlanChecker
+
+    server = serve(PlanChecker(num_workers=args.workers), args.host, args.port, args.batch_window, args.max_batch,
+                   args.max_concurrent)
+    print(f"Plan reward service listening on http://{args.host}:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
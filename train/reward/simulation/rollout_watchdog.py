@@ -0,0 +1,91 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Optional
+
+
+class RolloutTimeout(Exception):
+    """
+    A rollout missed a deadline. `reason` is "action_timeout" when a single simulator call took
+    too long and "episode_timeout" when the episode ran out of time.
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+    def info(self, step: int = 0) -> Dict:
+        return {"step": step, "success": False, "error": str(self), "reason": self.reason}
+
+
+class WatchdogController:
+    """
+    Wraps an AI2THOR controller so that step() and reset() run on a helper thread under a deadline.
+
+    Each call gets at most `action_timeout` seconds and never outlives the episode deadline set by
+    start_episode(). A call that misses its deadline is left running on the helper thread, the
+    controller is marked `hung` and every later call fails at once: the owner has to discard it.
+    Everything else (last_event, stop, ...) is forwarded to the wrapped controller.
+    """
+
+    def __init__(self, controller, action_timeout: Optional[float] = None, episode_timeout: Optional[float] = None):
+        self.controller = controller
+        self.action_timeout = action_timeout or None
+        self.episode_timeout = episode_timeout or None
+        self.deadline = None
+        self.hung = False
+        self.steps = 0 # simulator calls made through this wrapper
+        self.resets = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="controller-watchdog")
+
+    def start_episode(self, episodes: int = 1):
+        """
+        Start the episode clock, allowing `episode_timeout` seconds for each of `episodes` episodes.
+        """
+        self.deadline = None if self.episode_timeout is None else time.monotonic() + self.episode_timeout * episodes
+
+    def step(self, *args, **kwargs):
+        self.steps += 1
+        return self._call(self.controller.step, args, kwargs)
+
+    def reset(self, *args, **kwargs):
+        self.resets += 1
+        return self._call(self.controller.reset, args, kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+    def __getattr__(self, name):
+        return getattr(self.controller, name)
+
+    def _call(self, function, args, kwargs):
+        if self.hung:
+            raise RolloutTimeout("action_timeout", "The controller did not finish a previous action.")
+        timeout, reason = self.action_timeout, "action_timeout"
+        if self.deadline is not None:
+            remaining = self.deadline - time.monotonic()
+            if remaining <= 0:
+                raise RolloutTimeout("episode_timeout", f"The episode exceeded {self.episode_timeout}s.")
+            if timeout is None or remaining < timeout:
+                timeout, reason = remaining, "episode_timeout"
+        if timeout is None:
+            return function(*args, **kwargs)
+
+        future = self._executor.submit(function, *args, **kwargs)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self.hung = True
+            raise RolloutTimeout(reason, f"Controller {function.__name__} did not return within {timeout:.1f}s.")
+
+
+def stop_in_background(controller):
+    """
+    Stop a controller without waiting for it: a hung Unity process may never answer the quit request.
+    """
+    def stop():
+        try:
+            controller.stop()
+        except Exception as e:
+            print(f"Failed to stop hung controller: {e}")
+    threading.Thread(target=stop, name="controller-stop", daemon=True).start()
@@ -0,0 +1,139 @@
+import os
+import json
+import time
+import threading
+from typing import Dict, List, Optional
+
+# upper bounds (seconds) and labels of the histogram buckets in the per-call summary
+HISTOGRAM_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0, float("inf"))
+HISTOGRAM_LABELS = ("<1ms", "<10ms", "<100ms", "<1s", "<10s", ">=10s")
+
+
+def telemetry_path() -> Optional[str]:
+    """
+    JSONL file for plan reward telemetry, from PLAN_REWARD_TELEMETRY. Unset disables telemetry.
+    """
+    return os.environ.get("PLAN_REWARD_TELEMETRY") or None
+
+
+class _NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class PhaseTimer:
+    """
+    Wall time and call count per named phase. When disabled, phase() returns a shared no-op
+    context manager so instrumented code pays almost nothing.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.seconds = {}
+        self.counts = {}
+
+    def phase(self, name: str):
+        return _Phase(self, name) if self.enabled else _NULL_PHASE
+
+    def add(self, name: str, seconds: float):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + 1
+
+    def as_dict(self) -> Dict:
+        return {"seconds": dict(self.seconds), "counts": dict(self.counts)}
+
+
+def histogram(values: List[float]) -> Dict[str, int]:
+    counts = dict.fromkeys(HISTOGRAM_LABELS, 0)
+    for value in values:
+        for label, bound in zip(HISTOGRAM_LABELS, HISTOGRAM_BUCKETS):
+            if value < bound:
+                counts[label] += 1
+                break
+    return counts
+
+
+class RewardTelemetry:
+    """
+    Appends one record per completion to a JSONL file and closes every reward call with a summary
+    record: outcome and source counts, and a histogram per phase of the time spent on each completion.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.calls = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def record_call(self, records: List[Dict], seconds: float) -> Dict:
+        with self._lock:
+            self.calls += 1
+            summary = self.summarize(records)
+            summary.update({"type": "summary", "call": self.calls, "pid": os.getpid(), "seconds": seconds})
+            with open(self.path, "a") as f:
+                for record in records:
+                    record.update({"type": "completion", "call": self.calls, "pid": os.getpid()})
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+        print(f"Plan reward call {self.calls}: {len(records)} completions in {seconds:.2f}s, "
+              f"sources {summary['sources']}, sim steps {summary['sim_steps']}")
+        return summary
+
+    @staticmethod
+    def summarize(records: List[Dict]) -> Dict:
+        outcomes, sources, phases = {}, {}, {}
+        sim_steps = 0
+        for record in records:
+            outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+            sources[record["source"]] = sources.get(record["source"], 0) + 1
+            sim_steps += record.get("sim_steps", 0)
+            for name, seconds in record.get("phases", {}).items():
+                phases.setdefault(name, []).append(seconds)
+        return {
+            "completions": len(records),
+            "outcomes": outcomes,
+            "sources": sources,
+            "sim_steps": sim_steps,
+            "phases": {
+                name: {"total": sum(values), "max": max(values), "histogram": histogram(values)}
+                for name, values in sorted(phases.items())
+            },
+        }
+
+
+_default_telemetry = None
+
+
+def get_telemetry() -> Optional[RewardTelemetry]:
+    """
+    Return the process-wide telemetry writer, or None when telemetry is disabled.
+    """
+    global _default_telemetry
+    path = telemetry_path()
+    if path is None:
+        return None
+    if _default_telemetry is None or _default_telemetry.path != path:
+        _default_telemetry = RewardTelemetry(path)
+    return _default_telemetry
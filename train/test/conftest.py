@@ -0,0 +1,12 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The reward simulation modules import each other as top-level modules, as when they are run from
+# train/reward/simulation; the inference engine is imported as infer.ai2thor_engine.
+sys.path.insert(0, os.path.join(ROOT, "train", "reward", "simulation"))
+sys.path.insert(0, ROOT)
+
+# a swift reward plugin (TestAccuracy ORM), not a pytest module
+collect_ignore = ["test_accuracy_reward.py"]
@@ -0,0 +1,105 @@
+from controller_trace import ControllerTrace, RecordingController, ReplayController, TraceMiss
+
+
+class _Event:
+    def __init__(self, metadata):
+        self.metadata = metadata
+        self.pose_discrete = (metadata["agent"]["position"]["x"], 0, 0, 0)
+
+
+class _FakeController:
+    """
+    Deterministic stand-in for the simulator: the agent moves along x and can pick up the apple, which
+    changes the layout that GetReachablePositions answers from.
+    """
+
+    def __init__(self, scene):
+        self.scene = scene
+        self.reset(scene)
+
+    def reset(self, scene=None, **kwargs):
+        self.x, self.held = 0, False
+        return self._event(True)
+
+    def step(self, action=None, **kwargs):
+        if action == "MoveAhead":
+            self.x += 1
+        elif action == "PickupObject":
+            self.held = True
+        elif action == "GetReachablePositions":
+            return self._event(True, [x for x in range(5) if self.held or x != 3])
+        return self._event(True)
+
+    def _event(self, success, action_return=None):
+        apple = {"objectId": "Apple|1", "position": {"x": 3, "y": 0, "z": 0}, "rotation": {"x": 0, "y": 0, "z": 0},
+                 "isOpen": False, "openness": 0.0, "isToggled": False}
+        self.last_event = _Event({
+            "sceneName": self.scene,
+            "agent": {"position": {"x": self.x, "y": 0, "z": 0}, "rotation": {"x": 0, "y": 0, "z": 0},
+                      "cameraHorizon": 0, "isStanding": True},
+            "objects": [] if self.held else [apple],
+            "inventoryObjects": [{"objectId": "Apple|1"}] if self.held else [],
+            "lastActionSuccess": success,
+            "actionReturn": action_return,
+        })
+        return self.last_event
+
+
+def _run_group(controller, plan, layout_cache):
+    """
+    Mimics the agent: reachable positions are queried once per layout and reused from `layout_cache`.
+    """
+    controller.reset("FloorPlan1")
+    seen = []
+    for action in plan:
+        if action == "Reachable":
+            layout = controller.last_event.metadata["inventoryObjects"] != []
+            if layout not in layout_cache:
+                layout_cache[layout] = controller.step(action="GetReachablePositions").metadata["actionReturn"]
+            seen.append(layout_cache[layout])
+        else:
+            seen.append(controller.step(action=action).metadata["agent"]["position"]["x"])
+    return seen
+
+
+GROUPS = [
+    ["Reachable", "MoveAhead", "Reachable"],
+    ["MoveAhead", "Reachable", "PickupObject", "Reachable"],
+    ["MoveAhead", "MoveAhead", "Reachable", "Done", "MoveAhead"],
+]
+
+
+def _record(directory):
+    trace = ControllerTrace()
+    trace.record_to(directory)
+    controller = RecordingController(_FakeController("FloorPlan1"), trace, "FloorPlan1")
+    layout_cache = {}  # shared across the groups like a warm controller's layout cache
+    outcomes = [_run_group(controller, plan, layout_cache) for plan in GROUPS]
+    trace.close()
+    return outcomes
+
+
+def test_each_group_replays_on_its_own(tmp_path):
+    outcomes = _record(str(tmp_path))
+    trace = ControllerTrace.load(str(tmp_path))
+    for plan, outcome in zip(GROUPS, outcomes):
+        assert _run_group(ReplayController(trace, "FloorPlan1"), plan, {}) == outcome
+
+
+def test_groups_replay_in_any_order(tmp_path):
+    outcomes = _record(str(tmp_path))
+    trace = ControllerTrace.load(str(tmp_path))
+    controller, layout_cache = ReplayController(trace, "FloorPlan1"), {}
+    for plan, outcome in reversed(list(zip(GROUPS, outcomes))):
+        assert _run_group(controller, plan, layout_cache) == outcome
+
+
+def test_unrecorded_request_raises(tmp_path):
+    _record(str(tmp_path))
+    controller = ReplayController(ControllerTrace.load(str(tmp_path)), "FloorPlan1")
+    controller.reset("FloorPlan1")
+    try:
+        controller.step(action="RotateLeft")
+    except TraceMiss:
+        return
+    raise AssertionError("an unrecorded request must raise TraceMiss")
@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+import pytest
+
+from infer.ai2thor_engine.frame_writer import FrameWriter
+
+
+FAIL = 255
+
+
+class _Writer(FrameWriter):
+    """
+    Records what it encodes instead of writing files. Paths containing "bad" and images filled with FAIL
+    fail, and encoding can be held back with `gate` to check the order of writes to the same path.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.written = {}
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _encode(self, file_path, image, bgr):
+        self.gate.wait(5)
+        if "bad" in file_path or image[0, 0, 0] == FAIL:
+            raise OSError("disk full")
+        self.written[file_path] = int(image[0, 0, 0])
+
+
+def _image(value):
+    return np.full((2, 2, 3), value, dtype=np.uint8)
+
+
+def test_write_returns_the_path_before_the_frame_is_written():
+    writer = _Writer()
+    writer.gate.clear()
+    assert writer.write("a.png", _image(1)) == "a.png"
+    assert "a.png" not in writer.written
+    writer.gate.set()
+    writer.wait("a.png")
+    assert writer.written == {"a.png": 1}
+
+
+def test_wait_raises_a_failed_write_exactly_once():
+    writer = _Writer()
+    writer.gate.clear()  # wait() is called before the write fails
+    writer.write("bad.png", _image(1))
+    writer.write("good.png", _image(2))
+    writer.gate.set()
+    with pytest.raises(OSError, match="bad.png"):
+        writer.wait(["bad.png", "good.png"])
+    writer.wait("bad.png")
+    writer.flush()
+    assert writer.written == {"good.png": 2}
+
+
+def test_flush_raises_every_failed_write_once():
+    writer = _Writer()
+    writer.write("bad-1.png", _image(1))
+    writer.write("bad-2.png", _image(2))
+    writer.write("good.png", _image(3))
+    with pytest.raises(OSError, match="Failed to save 2 frame"):
+        writer.flush()
+    writer.flush()
+
+
+def test_a_failure_is_kept_until_it_is_waited_for():
+    writer = _Writer()
+    writer.write("bad.png", _image(1))
+    writer.wait("good.png")  # waiting for another path does not report it
+    with pytest.raises(OSError):
+        writer.flush()
+
+
+def test_writes_to_the_same_path_keep_their_order():
+    writer = _Writer(num_threads=4)
+    writer.gate.clear()
+    done = threading.Event()
+
+    def second_write():
+        writer.write("a.png", _image(2))  # waits for the first write to the path
+        done.set()
+
+    writer.write("a.png", _image(1))
+    thread = threading.Thread(target=second_write)
+    thread.start()
+    assert not done.wait(0.2)
+    writer.gate.set()
+    thread.join(5)
+    writer.flush()
+    assert writer.written == {"a.png": 2}
+
+
+def test_rewriting_a_failed_path_replaces_the_failure():
+    writer = _Writer()
+    writer.write("a.png", _image(FAIL))
+    writer.write("a.png", _image(2))  # the newer frame overwrites the failed one
+    writer.flush()
+    assert writer.written == {"a.png": 2}
+
+
+def test_synchronous_writer_raises_on_write():
+    writer = _Writer(asynchronous=False)
+    assert writer.write("a.png", _image(1)) == "a.png"
+    assert writer.written == {"a.png": 1}
+    with pytest.raises(OSError):
+        writer.write("bad.png", _image(1))
+    writer.flush()
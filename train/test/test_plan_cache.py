@@ -0,0 +1,146 @@
+import pytest
+
+from plan_cache import PlanOutcomeCache
+
+
+def _config(**changes):
+    config = dict(
+        scene="FloorPlan1",
+        task={"tasktype": "single_pickup", "actions": [{"action": "navigate to", "objectId": "Apple|1"}]},
+        task_id="7",
+        max_steps=5,
+        target_objects=["Apple|1"],
+        related_objects=["CounterTop|1"],
+        navigable_objects=["CounterTop", "Fridge"],
+        platform_type="GPU",
+    )
+    config.update(changes)
+    return config
+
+
+PLAN = ["navigate to CounterTop", "pickup Apple", "end"]
+
+
+@pytest.mark.parametrize("changes", [
+    dict(target_objects=["Apple|2"]),
+    dict(related_objects=["Fridge|1"]),
+    dict(navigable_objects=["CounterTop"]),
+    dict(task={"tasktype": "single_pickup", "actions": [{"action": "navigate to", "objectId": "Apple|2"}]}),
+    dict(scene="FloorPlan2"),
+    dict(max_steps=2),
+])
+def test_configs_that_change_the_rollout_get_different_keys(changes):
+    assert PlanOutcomeCache.make_key(PLAN, _config(**changes)) != PlanOutcomeCache.make_key(PLAN, _config())
+
+
+def test_platform_type_is_ignored():
+    assert PlanOutcomeCache.make_key(PLAN, _config(platform_type="CPU")) == PlanOutcomeCache.make_key(PLAN, _config())
+    config = _config()
+    del config["platform_type"]
+    assert PlanOutcomeCache.make_key(PLAN, config) == PlanOutcomeCache.make_key(PLAN, _config())
+
+
+def test_plan_is_cut_after_end():
+    assert PlanOutcomeCache.canonical_plan(["observe", " end", "pickup Apple"], 20) == ["observe", " end"]
+    assert PlanOutcomeCache.make_key(PLAN + ["pickup Apple"], _config()) == PlanOutcomeCache.make_key(PLAN, _config())
+    assert PlanOutcomeCache.make_key(PLAN[:2], _config()) != PlanOutcomeCache.make_key(PLAN, _config())
+
+
+def test_plan_is_cut_at_max_steps():
+    assert PlanOutcomeCache.canonical_plan(["observe"] * 8, 5) == ["observe"] * 5
+    assert PlanOutcomeCache.make_key(["observe"] * 8, _config()) == PlanOutcomeCache.make_key(["observe"] * 5, _config())
+    config = _config()
+    del config["max_steps"]  # the checker's default of 20 steps
+    assert PlanOutcomeCache.make_key(["observe"] * 25, config) == PlanOutcomeCache.make_key(["observe"] * 20, config)
+    assert PlanOutcomeCache.make_key(["observe"] * 19, config) != PlanOutcomeCache.make_key(["observe"] * 20, config)
+
+
+def test_infos_with_an_error_are_never_stored(tmp_path):
+    cache = PlanOutcomeCache(disk_path=str(tmp_path / "outcomes.sqlite"))
+    cache.put("key", {"step": 0, "success": False, "error": "worker died"})
+    assert cache.get("key") is None
+    assert PlanOutcomeCache(disk_path=str(tmp_path / "outcomes.sqlite")).get("key") is None
+
+
+def test_outcomes_round_trip_through_sqlite(tmp_path):
+    path = str(tmp_path / "cache" / "outcomes.sqlite")
+    key = PlanOutcomeCache.make_key(PLAN, _config())
+    PlanOutcomeCache(disk_path=path).put(key, {"step": 3, "success": True})
+
+    cache = PlanOutcomeCache(disk_path=path)
+    assert cache.get(key) == {"step": 3, "success": True}
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get(key) == {"step": 3, "success": True}  # now from memory
+    assert cache.stats()["disk_hits"] == 1
+    assert cache.get(PlanOutcomeCache.make_key(PLAN, _config(target_objects=[]))) is None
+
+
+def test_get_returns_a_copy():
+    cache = PlanOutcomeCache()
+    cache.put("key", {"step": 3, "success": True})
+    cache.get("key")["success"] = False
+    assert cache.get("key") == {"step": 3, "success": True}
+
+
+def test_memory_tier_evicts_least_recently_used():
+    cache = PlanOutcomeCache(max_entries=2)
+    cache.put("a", {"success": True})
+    cache.put("b", {"success": True})
+    cache.get("a")
+    cache.put("c", {"success": True})
+    assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+
+
+def _counting_checker():
+    plan_checker = pytest.importorskip("plan_checker")  # needs the simulator dependencies
+
+    class CountingChecker(plan_checker.PlanChecker):
+        """
+        Simulates nothing: records which plans reach run_checks and fails plans containing "crash"
+        with an infrastructure error.
+        """
+
+        def __init__(self):
+            super().__init__(controller_pool=None, num_workers=0)
+            self.simulated = []
+
+        def run_checks(self, jobs):
+            self.simulated.extend(plan for plan, _ in jobs)
+            return [
+                {"step": 0, "success": False, "error": "crash"} if "crash" in plan else {"step": len(plan), "success": True}
+                for plan, _ in jobs
+            ]
+
+    return CountingChecker()
+
+
+def test_identical_plans_in_a_batch_are_simulated_once(monkeypatch):
+    monkeypatch.setenv("PLAN_REWARD_CACHE_SIZE", "16")
+    monkeypatch.delenv("PLAN_REWARD_CACHE_PATH", raising=False)
+    checker = _counting_checker()
+    other = ["navigate to Fridge", "end"]
+    jobs = [(PLAN, _config()), (PLAN + ["observe"], _config()), (other, _config()), (PLAN, _config(platform_type="CPU"))]
+    infos = checker.cached_checks(jobs)
+    assert checker.simulated == [PLAN, other]
+    assert infos == [{"step": 3, "success": True}, {"step": 3, "success": True}, {"step": 2, "success": True},
+                     {"step": 3, "success": True}]
+    infos[0]["success"] = False
+    assert infos[1]["success"]  # twins get their own copy
+
+    # the same plan for another target is not a twin
+    checker.cached_checks([(PLAN, _config(target_objects=["Apple|2"]))])
+    assert checker.simulated == [PLAN, other, PLAN]
+
+    # answered from the cache on the next batch
+    assert checker.cached_checks([(other, _config())]) == [{"step": 2, "success": True}]
+    assert checker.simulated == [PLAN, other, PLAN]
+
+
+def test_failed_simulations_are_retried(monkeypatch):
+    monkeypatch.setenv("PLAN_REWARD_CACHE_SIZE", "16")
+    monkeypatch.delenv("PLAN_REWARD_CACHE_PATH", raising=False)
+    checker = _counting_checker()
+    plan = ["crash", "end"]
+    assert "error" in checker.cached_checks([(plan, _config())])[0]
+    assert "error" in checker.cached_checks([(plan, _config())])[0]
+    assert checker.simulated == [plan, plan]
@@ -0,0 +1,86 @@
+import pytest
+
+from plan_validator import PlanValidator, SceneCatalog, split_decision
+
+
+def _validator():
+    catalog = SceneCatalog()
+    catalog.update({"FloorPlan1": {"Apple": 1, "CounterTop": 1, "Cabinet": 3, "Fridge": 1}})
+    return PlanValidator(catalog)
+
+
+def _config(scene="FloorPlan1", max_steps=5):
+    return dict(scene=scene, max_steps=max_steps)
+
+
+@pytest.mark.parametrize("plan, config, reason", [
+    # steps the checker cannot parse
+    ([{"action": "navigate to", "object": "Apple"}, "end"], _config(), "malformed_step"),
+    (["navigate to Apple", None, "end"], _config(), "malformed_step"),
+    # the rollout never reaches an exact "end"/"End"
+    (["navigate to Apple", "pickup Apple"], _config(), "no_end"),
+    ([], _config(), "no_end"),
+    (["navigate to Apple", " end"], _config(), "no_end"),  # stops the episode, but is not a success step
+    (["navigate to Apple", "end."], _config(), "no_end"),
+    (["navigate to Apple", "endgame", "end"], _config(), "no_end"),  # stopped at "endgame"
+    (["observe"] * 5 + ["end"], _config(max_steps=5), "no_end"),  # "end" past max_steps
+    (["navigate to Apple", "end"], _config(scene="FloorPlan9"), None),  # no catalog entry: simulate
+    (["navigate to Apple"], _config(scene="FloorPlan9"), "no_end"),
+    (["observe", "end"], _config(scene="FloorPlan9"), "no_unique_object"),  # no object named at all
+    # "end" before any step names an object that exists exactly once
+    (["end"], _config(), "no_unique_object"),
+    (["observe", "move forward", "end"], _config(), "no_unique_object"),
+    (["navigate to Cabinet", "open Cabinet", "end"], _config(), "no_unique_object"),  # ambiguous
+    (["navigate to Sofa", "end"], _config(), "no_unique_object"),  # not in the scene
+    (["navigate to", "end"], _config(), "no_unique_object"),  # no object
+    (["End", "end"], _config(), "no_unique_object"),
+])
+def test_reject_reasons(plan, config, reason):
+    validator = _validator()
+    info = validator.validate(plan, config)
+    if reason is None:
+        assert info is None
+    else:
+        assert info == {"step": 0, "success": False, "rejected": reason}
+        assert validator.stats()["reasons"] == {reason: 1}
+
+
+@pytest.mark.parametrize("plan", [
+    ["navigate to Apple", "pickup Apple", "end"],
+    ["navigate to Apple", "End"],  # round_reward accepts "End" too
+    ["End", "navigate to Apple", "end"],  # "End" does not stop the rollout
+    ["navigate to Apple", "End", "observe", "End"],
+    ["   navigate to Apple", "end"],  # leading whitespace is stripped before the object is resolved
+    ["navigate to   Apple  ", "end"],
+    ["navigate to Cabinet", "navigate to Fridge", "end"],
+    ["observe", "observe", "observe", "navigate to Apple", "end"],  # "end" is the last step within max_steps
+    ["navigate to Apple", "end", {"trailing": "ignored"}],  # steps after "end" are never executed
+])
+def test_plans_the_rollout_may_accept_are_simulated(plan):
+    validator = _validator()
+    assert validator.validate(plan, _config()) is None
+    assert validator.stats()["rejected"] == 0
+
+
+@pytest.mark.parametrize("plan", [
+    ["navigate to Sofa", "end"],
+    ["navigate to Cabinet", "end"],
+    ["End", "open Cabinet", "End"],
+])
+def test_catalog_miss_falls_through_to_simulation(plan):
+    assert _validator().validate(plan, _config(scene="FloorPlan9")) is None
+
+
+@pytest.mark.parametrize("step, expected", [
+    ("end", ("end", None)),
+    ("  end", ("end", None)),
+    ("End", (None, None)),  # the checker observes on it and keeps going
+    ("observe", ("observe", None)),
+    ("move forward", ("move forward", None)),
+    ("navigate to Apple", ("navigate to", "Apple")),
+    (" put in  Fridge ", ("put in", "Fridge")),
+    ("pickup", ("pickup", "")),
+    ("fly to the moon", (None, None)),
+])
+def test_split_decision(step, expected):
+    assert split_decision(step) == expected
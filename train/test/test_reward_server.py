@@ -0,0 +1,84 @@
+import threading
+import time
+
+from reward_server import BatchingService
+
+
+class _DelayChecker:
+    """
+    Stand-in for PlanChecker: a group takes env_config["delay"] seconds and every plan succeeds
+    unless env_config asks for an error.
+    """
+
+    num_workers = 2
+
+    def __init__(self):
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def check_plans(self, jobs):
+        env_config = jobs[0][1]
+        with self._lock:
+            self.calls.append([plan for plan, _ in jobs])
+        time.sleep(env_config["delay"])
+        if env_config.get("error"):
+            raise RuntimeError("simulator crashed")
+        return [{"plan": plan, "success": True} for plan, _ in jobs]
+
+    def stats(self):
+        return {}
+
+
+def _jobs(name, delay, count=2, **extra):
+    return [([f"{name}-{i}", "end"], dict(scene=name, delay=delay, **extra)) for i in range(count)]
+
+
+def test_fast_request_does_not_wait_for_slow_group():
+    service = BatchingService(_DelayChecker(), batch_window=0.05)
+    slow = service.submit(_jobs("slow", 1.0))
+    fast = service.submit(_jobs("fast", 0.0))
+    started = time.monotonic()
+    assert [info["plan"] for info in fast.result(timeout=5)] == [["fast-0", "end"], ["fast-1", "end"]]
+    assert time.monotonic() - started < 0.5
+    assert not slow.done()
+    assert [info["plan"] for info in slow.result(timeout=5)] == [["slow-0", "end"], ["slow-1", "end"]]
+
+
+def test_request_arriving_during_a_batch_starts_right_away():
+    service = BatchingService(_DelayChecker(), batch_window=0.01)
+    slow = service.submit(_jobs("slow", 1.0))
+    time.sleep(0.1)  # the first batch is simulating
+    started = time.monotonic()
+    late = service.submit(_jobs("late", 0.0))
+    late.result(timeout=5)
+    assert time.monotonic() - started < 0.5
+    assert not slow.done()
+    slow.result(timeout=5)
+
+
+def test_requests_with_the_same_env_config_share_one_group():
+    checker = _DelayChecker()
+    service = BatchingService(checker, batch_window=0.2)
+    first = service.submit(_jobs("shared", 0.0, count=2))
+    second = service.submit(_jobs("shared", 0.0, count=1) + _jobs("other", 0.1, count=1))
+    assert [info["plan"][0] for info in first.result(timeout=5)] == ["shared-0", "shared-1"]
+    assert [info["plan"][0] for info in second.result(timeout=5)] == ["shared-0", "other-0"]
+    assert sorted(len(plans) for plans in checker.calls) == [1, 3]
+    assert service.stats()["groups"] == 2
+
+
+def test_group_error_fails_only_its_requests():
+    service = BatchingService(_DelayChecker(), batch_window=0.05)
+    broken = service.submit(_jobs("broken", 0.0, error=True))
+    healthy = service.submit(_jobs("healthy", 0.1))
+    try:
+        broken.result(timeout=5)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("the group's error must reach its request")
+    assert all(info["success"] for info in healthy.result(timeout=5))
+
+
+def test_empty_request_resolves_immediately():
+    assert BatchingService(_DelayChecker()).submit([]).result(timeout=1) == []
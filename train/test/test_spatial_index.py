@@ -0,0 +1,110 @@
+import math
+import random
+
+from infer.ai2thor_engine.spatial_index import CandidateQueue, PositionIndex, position_key
+
+
+def _positions(rng, count):
+    """
+    Grid positions like GetReachablePositions returns, with duplicates so that distances tie.
+    """
+    positions = [{"x": rng.randint(-12, 12) * 0.25, "y": 0.9, "z": rng.randint(-12, 12) * 0.25} for _ in range(count)]
+    positions += [dict(rng.choice(positions)) for _ in range(count // 5)]
+    rng.shuffle(positions)
+    return positions
+
+
+def _queries(rng):
+    # grid points and cell midpoints tie with many positions, random points with few
+    for _ in range(20):
+        yield rng.randint(-14, 14) * 0.25, rng.randint(-14, 14) * 0.25
+        yield rng.randint(-28, 28) * 0.125, rng.randint(-28, 28) * 0.125
+        yield rng.uniform(-4, 4), rng.uniform(-4, 4)
+
+
+def _exclude(rng, positions):
+    return {position_key(position) for position in rng.sample(positions, rng.randint(0, len(positions) // 3))}
+
+
+def _distance(position, x, z):
+    return math.sqrt((position["x"] - x)**2 + (position["z"] - z)**2)
+
+
+def _scan(positions, x, z, exclude=(), max_distance=float("inf")):
+    """
+    The linear scan the index replaces: (distance, list index) order, nearer and earlier first.
+    """
+    found = [
+        (_distance(position, x, z), i)
+        for i, position in enumerate(positions)
+        if _distance(position, x, z) <= max_distance and position_key(position) not in exclude
+    ]
+    return [positions[i] for _, i in sorted(found)]
+
+
+def test_nearest_and_k_nearest_match_a_linear_scan():
+    rng = random.Random(0)
+    for trial in range(30):
+        positions = _positions(rng, rng.randint(0, 80))
+        index = PositionIndex(positions, cell_size=rng.choice([0.25, 0.5, 1.0]))
+        for x, z in _queries(rng):
+            exclude = _exclude(rng, positions) if positions else set()
+            max_distance = rng.choice([float("inf"), rng.uniform(0.25, 3)])
+            expected = _scan(positions, x, z, exclude, max_distance)
+            nearest = index.nearest(x, z, exclude, max_distance)
+            assert nearest is (expected[0] if expected else None)
+            k = rng.randint(1, 12)
+            found = index.k_nearest(x, z, k, exclude, max_distance)
+            assert [id(position) for position in found] == [id(position) for position in expected[:k]]
+
+
+def test_within_and_band_match_a_linear_scan():
+    rng = random.Random(1)
+    for trial in range(30):
+        positions = _positions(rng, rng.randint(0, 80))
+        index = PositionIndex(positions, cell_size=rng.choice([0.25, 0.5, 1.0]))
+        for x, z in _queries(rng):
+            exclude = _exclude(rng, positions) if positions else set()
+            radius = rng.choice([0.0, 0.25, 0.5, rng.uniform(0, 3)])
+            expected = [
+                position for position in positions
+                if _distance(position, x, z) <= radius and position_key(position) not in exclude
+            ]
+            assert [id(p) for p in index.within(x, z, radius, exclude)] == [id(p) for p in expected]
+            axis, value = rng.choice([("x", x), ("z", z)])
+            tolerance = rng.choice([0.0, 0.125, 0.25, rng.uniform(0, 1)])
+            expected = [
+                position for position in positions
+                if abs(position[axis] - value) <= tolerance and position_key(position) not in exclude
+            ]
+            assert [id(p) for p in index.band(axis, value, tolerance, exclude)] == [id(p) for p in expected]
+
+
+def test_candidate_queue_follows_the_scan_order_and_skips_rejected_positions():
+    rng = random.Random(2)
+    positions = _positions(rng, 60)
+    index = PositionIndex(positions)
+    x, z = 0.3, -0.4
+
+    def next_candidate(exclude):
+        return index.nearest(x, z, exclude), None
+
+    # distinct positions in scan order: the first of every group of duplicates
+    expected, seen = [], set()
+    for position in _scan(positions, x, z):
+        if position_key(position) not in seen:
+            seen.add(position_key(position))
+            expected.append(position)
+
+    first = CandidateQueue(next_candidate)
+    popped = [first.pop()[0] for _ in range(5)]
+    assert popped == expected[:5]
+    first.reject(popped[1])
+    first.reject(expected[6])
+
+    # a second queue shares the ranking and the blacklist, and skips the rejected positions
+    second = CandidateQueue(next_candidate, first.ranking, first.blacklist)
+    rejected = {position_key(popped[1]), position_key(expected[6])}
+    remaining = [position for position in expected if position_key(position) not in rejected]
+    assert [second.pop()[0] for _ in range(len(remaining))] == remaining
+    assert second.pop() == (None, None)
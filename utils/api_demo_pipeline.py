@@ -278,6 +278,7 @@ Review the 'CRITICAL RULES' from the system prompt. Based on all the visual info
 
         historical_image_paths = [h['image_path'] for h in action_history[-NUM_HISTORICAL_IMAGES:]]
         all_image_paths = historical_image_paths + [image_fp]
+        agent.frame_writer.wait(all_image_paths)  # frames are saved in the background
 
         api_output_dict = call_llm_api(QWEN_API_KEY, SYSTEM_PROMPT, user_prompt, logger, image_paths=all_image_paths)
         